@@ -1,16 +1,24 @@
 import argparse
+from contextlib import nullcontext
 import sys
 
+from models.daemon import Daemon
+from models.extraction import ExtractionQueue
 from models.fetcher import EpisodeFetcher
 from models.tvdb import TVDBAPI
+from utils.metrics import MetricsExporter
+from utils.profiling import MODES, Profiler
 
 
-config_fp = "config.ini"
-
 parser = argparse.ArgumentParser()
+parser.add_argument("--config", default="config.ini",
+                    help="Config file to use (default config.ini)")
 parser.add_argument("--add-series", help="Search string of Series name to add")
 parser.add_argument("--add-eps", action="store_true",
                     help="Add new episodes")
+parser.add_argument("--full-sync", action="store_true",
+                    help="With --add-eps, sync every series instead of only "
+                         "those updated on TVDB since the last sync")
 parser.add_argument("--series-ids", nargs="*", type=int,
                     help="Limit to series_ids")
 parser.add_argument("--download", action="store_true",
@@ -19,6 +27,14 @@ parser.add_argument("--pause-transfer", action="store_true",
                     help="Do not immediately start torrent transfers")
 parser.add_argument("--status", action="store_true",
                     help="Check for any completed transfers and process them")
+parser.add_argument("--extract", action="store_true",
+                    help="Extract archives queued by --status")
+parser.add_argument("--requeue-missing", action="store_true",
+                    help="With --status, re-add active torrents missing "
+                         "from bit-torrent")
+parser.add_argument("--daemon", action="store_true",
+                    help="Keep running, searching, checking status, "
+                         "extracting and syncing on the [daemon] intervals")
 parser.add_argument("--view-series", help="View added series info",
                     action="store_true")
 parser.add_argument(
@@ -26,37 +42,100 @@ parser.add_argument(
     help="Search for episodes using a shortened episode name",
     action="store_true",
 )
+parser.add_argument("--profile", choices=MODES,
+                    help="Profile the run with cProfile or a sampling "
+                         "profiler (all threads), and print per-action SQL "
+                         "statement counts and durations")
+parser.add_argument("--profile-output",
+                    help="Profile file to write (default profile_<actions> "
+                         "with .prof for cprofile, or collapsed stacks in "
+                         ".folded for sample)")
 
 
 args = parser.parse_args()
+config_fp = args.config
+
+
+def profiled(action):
+    if profiler is None:
+        return nullcontext()
+    return profiler.action(action)
+
 
 if __name__ == "__main__":
-    fetcher = EpisodeFetcher(
-        config_fp,
-        shortened_searches=args.shortened_searches
+    job = "_".join(
+        action
+        for action in ("daemon", "add_eps", "download", "status", "extract")
+        if getattr(args, action)
     )
+    profiler = None
+    if args.profile:
+        profiler = Profiler(args.profile, args.profile_output, job=job)
+        profiler.start()
+
+    if args.daemon:
+        try:
+            with profiled("daemon"):
+                Daemon.from_config(
+                    config_fp,
+                    series_ids=args.series_ids,
+                    shortened_searches=args.shortened_searches,
+                    requeue_missing=args.requeue_missing,
+                ).run()
+        finally:
+            if profiler is not None:
+                profiler.stop()
+        sys.exit(0)
+
     if args.view_series:
         api = TVDBAPI(config_fp)
-        api.view_all_series()
+        try:
+            with profiled("view_series"):
+                api.view_all_series()
+        finally:
+            if profiler is not None:
+                profiler.stop()
         sys.exit(0)
 
-    if args.series_ids is None:
-        series_ids = []
+    exporter = MetricsExporter.from_config(config_fp, job=job or None)
+    try:
+        if args.download or args.status:
+            fetcher = EpisodeFetcher(
+                config_fp,
+                shortened_searches=args.shortened_searches
+            )
 
-    if args.add_series or args.add_eps:
-        api = TVDBAPI(config_fp)
-        api.login()
+        if args.series_ids is None:
+            series_ids = []
 
-    if args.add_series:
-        api.search_and_add_new_series(args.add_series)
-    if args.add_eps:
-        api.add_series_episodes(series_ids=args.series_ids)
+        if args.add_series or args.add_eps:
+            api = TVDBAPI(config_fp)
+            api.login()
 
-    if args.download:
-        fetcher.download_all_non_complete_episodes(
-            series_ids=args.series_ids,
-            pause_transfer=args.pause_transfer
-        )
-    if args.status:
-        fetcher.check_downloading_torrents()
+        if args.add_series:
+            api.search_and_add_new_series(args.add_series)
+        if args.add_eps:
+            with profiled("add_eps"):
+                api.add_series_episodes(series_ids=args.series_ids,
+                                        full=args.full_sync)
 
+        if args.download:
+            with profiled("download"):
+                fetcher.download_all_non_complete_episodes(
+                    series_ids=args.series_ids,
+                    pause_transfer=args.pause_transfer
+                )
+        if args.status:
+            with profiled("status"):
+                fetcher.check_downloading_torrents(
+                    requeue_missing=args.requeue_missing
+                )
+        if args.extract:
+            # Jackett needn't be up to extract: no EpisodeFetcher here.
+            with profiled("extract"):
+                ExtractionQueue.from_config_file(config_fp).run()
+    finally:
+        # Failed runs are the ones their metrics and profile matter for.
+        exporter.finish()
+        if profiler is not None:
+            profiler.stop()
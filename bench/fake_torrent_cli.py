@@ -0,0 +1,37 @@
+"""
+Stand-in for bit-torrent's `torrent_cli.py status -v`.
+
+Prints a status block for every "<info_hash> <progress>" line of the
+file named by $BENCH_STATUS_FILE, in torrent_cli.py's output format.
+Other commands (add, pause) succeed silently.
+"""
+import os
+import sys
+
+STATUS = """Name: {name}
+ID: {info_hash}
+State: {state}
+Download speed: 1.5 MiB/s        Upload speed: 200.0 KiB/s
+Size: {completed:.1f} MiB/140.0 MiB     Ratio: 0.5
+Progress: {progress:.1f}%
+"""
+
+
+def main(argv):
+    if argv[1:2] != ["status"]:
+        return
+    with open(os.environ["BENCH_STATUS_FILE"]) as f:
+        for i, line in enumerate(f):
+            info_hash, progress = line.split()
+            progress = float(progress)
+            sys.stdout.write(STATUS.format(
+                name=f"Bench.Torrent.{i}",
+                info_hash=info_hash,
+                state="Uploading" if progress >= 100 else "Downloading",
+                completed=140.0 * progress / 100,
+                progress=progress,
+            ))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
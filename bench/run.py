@@ -0,0 +1,288 @@
+"""
+Offline benchmarks for searching, TVDB sync, status reconciliation and
+extraction, against local stand-ins for Jackett, TVDB and torrent_cli.py.
+
+    python -m bench.run --episodes 100000 --latency 50
+    python -m bench.run --only search status --json results.json
+
+Each benchmark reports throughput and, where there are per-request
+calls, their latency percentiles.
+"""
+import argparse
+from contextlib import contextmanager
+from functools import wraps
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+from bench.stubs import StubServer
+from bench.synthetic import build_db
+from models.db import EpisodeTorrent, get_session
+from models.extraction import ExtractionQueue
+from models.fetcher import EpisodeFetcher
+from models.tvdb import TVDBAPI
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_TORRENT_CLI = os.path.join(BENCH_DIR, "fake_torrent_cli.py")
+RAR_FIXTURE = os.path.join(BENCH_DIR, "..", "tests", "files")
+MB = 1024 * 1024
+
+CONFIG = """[db]
+uri = {db_uri}
+
+[thetvdb.com]
+endpoint = {url}
+apikey = bench
+sync_workers = {workers}
+requests_per_second = 10000
+request_burst = 10000
+
+[jackett]
+apikey = bench
+host = {url}
+trackers = tracker_a
+torrent_directory = {torrent_directory}
+search_workers = {workers}
+indexer_concurrency = {workers}
+cache_ttl = 0
+bittorrent_python = {python}
+bittorrent_cli = {torrent_cli}
+
+[schedule]
+grace_hours = 0
+max_episodes = {searches}
+
+[metrics]
+summary = false
+"""
+
+
+class Timings:
+    """Durations of individual calls, for latency percentiles."""
+
+    def __init__(self):
+        self.durations = []
+
+    def wrap(self, func):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.durations.append(time.monotonic() - started)
+        return timed
+
+    def percentile(self, p):
+        durations = sorted(self.durations)
+        if not durations:
+            return 0.0
+        return durations[min(len(durations) - 1, int(p * len(durations)))]
+
+    def report(self):
+        return {
+            "calls": len(self.durations),
+            "p50_ms": round(self.percentile(0.5) * 1000, 2),
+            "p95_ms": round(self.percentile(0.95) * 1000, 2),
+            "max_ms": round(self.percentile(1.0) * 1000, 2),
+        }
+
+
+@contextmanager
+def stopwatch(result):
+    started = time.monotonic()
+    yield
+    result["seconds"] = round(time.monotonic() - started, 3)
+
+
+def _rate(count, seconds):
+    return round(count / seconds, 1) if seconds else None
+
+
+class Bench:
+
+    def __init__(self, args, tmp):
+        self.args = args
+        self.tmp = tmp
+        self.stub = StubServer(latency=args.latency / 1000,
+                               results=args.results, pages=args.pages)
+
+    def config(self, name):
+        db_path = os.path.join(self.tmp, f"{name}.db")
+        torrent_directory = os.path.join(self.tmp, f"{name}_torrents")
+        os.makedirs(torrent_directory, exist_ok=True)
+        return "sqlite:///" + db_path, CONFIG.format(
+            db_uri="sqlite:///" + db_path,
+            url=self.stub.url,
+            workers=self.args.workers,
+            torrent_directory=torrent_directory,
+            python=sys.executable,
+            torrent_cli=FAKE_TORRENT_CLI,
+            searches=self.args.searches,
+        )
+
+    def search(self):
+        db_uri, config = self.config("search")
+        build_db(db_uri, episodes=self.args.episodes)
+        fetcher = EpisodeFetcher(config)
+        searches = Timings()
+        fetcher.jackett.search = searches.wrap(fetcher.jackett.search)
+
+        result = {"episodes": self.args.episodes}
+        queue = {}
+        with stopwatch(queue):
+            searched = len(fetcher.search_queue_records())
+        result["queue_build_seconds"] = queue["seconds"]
+        with stopwatch(result):
+            fetcher.download_all_non_complete_episodes(pause_transfer=True)
+        grabbed = fetcher.session.query(EpisodeTorrent).count()
+        result.update(
+            searched=searched,
+            grabbed=grabbed,
+            episodes_per_second=_rate(searched, result["seconds"]),
+            search_latency=searches.report(),
+        )
+        return result
+
+    def sync(self):
+        db_uri, config = self.config("sync")
+        build_db(db_uri, series=self.args.sync_series)
+        api = TVDBAPI(config)
+        requests = Timings()
+        api._get = requests.wrap(api._get)
+        api.login()
+
+        result = {"series": self.args.sync_series}
+        with stopwatch(result):
+            api.add_series_episodes(full=True)
+        synced = self.args.sync_series * self.args.pages * self.stub.page_size
+        result.update(
+            episodes=synced,
+            episodes_per_second=_rate(synced, result["seconds"]),
+            request_latency=requests.report(),
+        )
+        return result
+
+    def status(self):
+        db_uri, config = self.config("status")
+        info_hashes = build_db(db_uri, episodes=self.args.torrents,
+                               torrents=self.args.torrents)
+        status_file = os.path.join(self.tmp, "status.txt")
+        with open(status_file, "w") as f:
+            for i, info_hash in enumerate(info_hashes):
+                f.write(f"{info_hash} {100.0 if i % 2 else 42.0}\n")
+        os.environ["BENCH_STATUS_FILE"] = status_file
+
+        fetcher = EpisodeFetcher(config)
+        result = {"torrents": self.args.torrents}
+        with stopwatch(result):
+            fetcher.check_downloading_torrents()
+        result["torrents_per_second"] = _rate(self.args.torrents,
+                                              result["seconds"])
+        return result
+
+    def _archives(self, name):
+        folder = os.path.join(self.tmp, name)
+        os.makedirs(folder)
+        chunk = bytes(range(256)) * 4096
+        paths = []
+        for i in range(self.args.archives):
+            path = os.path.join(folder, f"archive{i}.zip")
+            with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as z:
+                with z.open("episode.mkv", "w") as member:
+                    for _ in range(self.args.archive_mb):
+                        member.write(chunk)
+            paths.append(path)
+        return paths
+
+    def extraction(self):
+        backends = ["zip", "rar"] + (["7z"] if shutil.which("7z") else [])
+        results = {}
+        zips = self._archives("archives")
+        for backend in backends:
+            if backend == "rar":
+                archives = [os.path.join(RAR_FIXTURE, "rar3-old.rar")]
+                size = sum(
+                    os.path.getsize(os.path.join(RAR_FIXTURE, name))
+                    for name in os.listdir(RAR_FIXTURE)
+                )
+            else:
+                archives = zips
+                size = self.args.archive_mb * MB
+            session = get_session("sqlite://")
+            queue = ExtractionQueue(session, workers=self.args.workers,
+                                    niceness=0, ionice=False,
+                                    background=False, backend=backend)
+            torrent = EpisodeTorrent(info_hash=backend)
+            session.add(torrent)
+            for i, archive in enumerate(archives):
+                output = os.path.join(self.tmp, "out", backend, str(i))
+                queue.enqueue(torrent, archive, output)
+            session.commit()
+
+            result = {"archives": len(archives)}
+            with stopwatch(result):
+                queue.run()
+            result["mb_per_second"] = _rate(
+                len(archives) * size / MB, result["seconds"]
+            )
+            results[backend] = result
+        return results
+
+    def run(self, benchmarks):
+        self.stub.start()
+        try:
+            return {name: getattr(self, name)() for name in benchmarks}
+        finally:
+            self.stub.stop()
+
+
+BENCHMARKS = ["search", "sync", "status", "extraction"]
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+parser.add_argument("--only", nargs="*", choices=BENCHMARKS,
+                    default=BENCHMARKS, help="Benchmarks to run")
+parser.add_argument("--episodes", type=int, default=10000,
+                    help="Episodes in the search benchmark's database")
+parser.add_argument("--searches", type=int, default=200,
+                    help="Episodes searched per run (schedule max_episodes)")
+parser.add_argument("--latency", type=float, default=50,
+                    help="Stub server latency per request, in ms")
+parser.add_argument("--results", type=int, default=5,
+                    help="Results per Jackett search")
+parser.add_argument("--workers", type=int, default=8,
+                    help="Search, sync and extraction workers")
+parser.add_argument("--sync-series", type=int, default=20,
+                    help="Series synced in the sync benchmark")
+parser.add_argument("--pages", type=int, default=3,
+                    help="TVDB pages of 100 episodes per series")
+parser.add_argument("--torrents", type=int, default=10000,
+                    help="Active torrents in the status benchmark")
+parser.add_argument("--archives", type=int, default=4,
+                    help="Zip archives in the extraction benchmark")
+parser.add_argument("--archive-mb", type=int, default=32,
+                    help="Size of each zip archive, in MiB")
+parser.add_argument("--json", help="Also write the results to this file")
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    tmp = tempfile.mkdtemp(prefix="torrent_automator_bench_")
+    try:
+        results = Bench(args, tmp).run(args.only)
+    finally:
+        shutil.rmtree(tmp)
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Local stand-ins for the services the fetcher talks to: a threaded HTTP
+server answering the Jackett search/.torrent download and TVDB
+login/episodes/updated endpoints with synthetic data after a configurable
+latency.
+"""
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from urllib.parse import parse_qs, quote, urlparse
+
+JACKETT_SEARCH = "/api/v2.0/indexers/all/results"
+
+
+def bencode(value):
+    if isinstance(value, int):
+        return b"i%de" % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b"%d:%s" % (len(value), value)
+    if isinstance(value, list):
+        return b"l" + b"".join(bencode(v) for v in value) + b"e"
+    return b"d" + b"".join(
+        bencode(k) + bencode(v) for k, v in sorted(value.items())
+    ) + b"e"
+
+
+def torrent_info(filename, files=3, piece_count=64):
+    """Info dict of a synthetic multi-file release named `filename`."""
+    return {
+        "name": filename,
+        "piece length": 262144,
+        "pieces": hashlib.sha1(filename.encode()).digest() * piece_count,
+        "files": [
+            {"length": 262144 * piece_count // files,
+             "path": [f"{filename}.r{i:02d}" if i else f"{filename}.rar"]}
+            for i in range(files)
+        ],
+    }
+
+
+def torrent_bytes(filename):
+    return bencode({
+        "announce": "http://localhost/announce",
+        "info": torrent_info(filename),
+    })
+
+
+def info_hash(filename):
+    return hashlib.sha1(bencode(torrent_info(filename))).hexdigest()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; don't let Nagle's
+    # algorithm add delayed-ACK stalls to every keep-alive response.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        stub = self.server.stub
+        time.sleep(stub.latency)
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")
+
+        if url.path == JACKETT_SEARCH:
+            return self._send(stub.search_results(params.get("Query", "")))
+        if parts[0] == "dl":
+            return self._send(torrent_bytes(params["file"]),
+                              "application/x-bittorrent")
+        if url.path == "/login":
+            return self._send({"token": "bench"})
+        if url.path == "/updated/query":
+            return self._send({"data": []})
+        if parts[0] == "series" and parts[-1] == "episodes":
+            page = int(params.get("page", 1))
+            return self._send(stub.episode_page(int(parts[1]), page))
+        self.send_error(404)
+
+    def do_GET(self):
+        self._route()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._route()
+
+
+class StubServer:
+    """
+    Jackett and TVDB stand-in on an ephemeral local port.
+
+    Every request waits `latency` seconds before answering. Searches
+    return `results` results each; every series has `pages` pages of
+    `page_size` episodes.
+    """
+
+    def __init__(self, latency=0.0, results=5, pages=3, page_size=100):
+        self.latency = latency
+        self.results = results
+        self.pages = pages
+        self.page_size = page_size
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def search_results(self, query):
+        results = []
+        for i in range(self.results):
+            filename = "{}.{}".format(".".join(query.split()), i)
+            results.append({
+                "Title": f"{query} 720p x264 {i}",
+                "Seeders": 100 - i * 10,
+                "Peers": 120,
+                "Size": 500 * 1024 * 1024,
+                "Link": (
+                    f"{self.url}/dl/tracker_a/?jackett_apikey=bench"
+                    f"&path=p&file={quote(filename)}"
+                ),
+                "InfoHash": info_hash(filename),
+            })
+        return {"Results": results}
+
+    def episode_page(self, series_id, page):
+        first = (page - 1) * self.page_size
+        data = [
+            {
+                "id": series_id * 100000 + first + i,
+                "seriesId": series_id,
+                "airedSeason": 1 + (first + i) // 20,
+                "airedEpisodeNumber": 1 + (first + i) % 20,
+                "episodeName": f"Episode {first + i}",
+                "firstAired": "2015-01-01",
+                "overview": "",
+            }
+            for i in range(self.page_size)
+        ]
+        return {
+            "data": data,
+            "links": {"next": page + 1 if page < self.pages else None},
+        }
@@ -0,0 +1,71 @@
+"""Synthetic databases of series, episodes and torrents for benchmarks."""
+from datetime import datetime, timedelta
+import hashlib
+
+from models.db import Episode, EpisodeTorrent, Series, get_engine
+
+CHUNK = 20000
+EPISODES_PER_SERIES = 200
+
+
+def _chunks(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _insert(engine, table, rows):
+    for chunk in _chunks(rows):
+        engine.execute(table.insert(), chunk)
+
+
+def build_db(db_uri, episodes=0, series=None, torrents=0):
+    """
+    Fill `db_uri` with `series` series (by default one per 200 episodes)
+    and `episodes` episodes spread over them, aired over the last ten
+    years. The first `torrents` episodes get an active torrent.
+    Returns the torrents' info hashes.
+    """
+    engine = get_engine(db_uri)
+    if series is None:
+        series = max(1, -(-episodes // EPISODES_PER_SERIES))
+    _insert(engine, Series.__table__, (
+        {"id": series_id, "name": f"Bench Series {series_id}", "pages": 0}
+        for series_id in range(1, series + 1)
+    ))
+
+    now = datetime.utcnow()
+    _insert(engine, Episode.__table__, (
+        {
+            "series_id": 1 + n % series,
+            "id": n,
+            "season_number": 1 + (n // series) // 20,
+            "episode_number": 1 + (n // series) % 20,
+            "name": f"Episode {n}",
+            "air_date": now - timedelta(days=1 + n % 3650),
+            "search_attempts": 0,
+        }
+        for n in range(episodes)
+    ))
+
+    info_hashes = [
+        hashlib.sha1(str(n).encode()).hexdigest() for n in range(torrents)
+    ]
+    _insert(engine, EpisodeTorrent.__table__, (
+        {
+            "info_hash": info_hash,
+            "episode_id": n,
+            "filename": f"bench.{n}",
+            "torrent_name": f"Bench.Torrent.{n}",
+            "complete": False,
+            "created_at": now - timedelta(days=1),
+        }
+        for n, info_hash in enumerate(info_hashes)
+    ))
+    engine.dispose()
+    return info_hashes
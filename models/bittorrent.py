@@ -0,0 +1,157 @@
+import asyncio
+from functools import partial
+import os
+import sys
+
+from .status import TorrentStatus
+
+BITTORRENT_DIR = os.path.join(
+    os.path.split(os.path.abspath(__file__))[0],
+    "..",
+    "vendor",
+    "bit-torrent",
+)
+
+
+def append_bittorrent_path():
+    if BITTORRENT_DIR not in sys.path:
+        sys.path.append(BITTORRENT_DIR)
+
+
+class BitTorrentClient:
+    """
+    Drives the running bit-torrent daemon from this process over its
+    control channel, instead of spawning torrent_cli.py per action.
+
+    One control connection is opened on first use and reused while it
+    stays up. When it drops (bit-torrent restarted), it is closed and the
+    next call connects again. When the vendored `torrent_client` package
+    can't be imported, or the daemon can't be reached, calls fall back to
+    Jackett's torrent_cli.py wrappers.
+    """
+
+    def __init__(self, jackett):
+        self.jackett = jackett
+        self.loop = None
+        self.client = None
+        self.available = None
+
+    def _connect(self):
+        if self.client is not None:
+            return True
+        try:
+            append_bittorrent_path()
+            from torrent_client.control import ControlClient
+            self.loop = asyncio.new_event_loop()
+            self.client = ControlClient()
+            self.loop.run_until_complete(self.client.connect())
+        except (ImportError, RuntimeError, OSError) as e:
+            if self.available is not False:
+                print(f"bit-torrent control channel unavailable ({e!r}), "
+                      "falling back to torrent_cli.py")
+            self.close()
+            self.available = False
+            return False
+        self.available = True
+        return True
+
+    def _execute(self, action):
+        """
+        Run one action in the daemon. Errors the daemon raises for the
+        action propagate; a lost connection is closed and raised as a
+        ConnectionError, so the caller can fall back.
+        """
+        try:
+            return self.loop.run_until_complete(self.client.execute(action))
+        except (OSError, EOFError) as e:
+            print(f"bit-torrent control channel lost ({e!r})")
+            self.close()
+            self.available = None
+            raise ConnectionError(e) from e
+
+    def add(self, torrents):
+        """Start transfers for every (torrent_file, download_dir) pair."""
+        for torrent_file, download_dir in torrents:
+            if self._connect():
+                from torrent_client.control import ControlManager
+                from torrent_client.models import TorrentInfo
+                try:
+                    self._execute(partial(
+                        ControlManager.add,
+                        torrent_info=TorrentInfo.from_file(
+                            torrent_file, download_dir=download_dir,
+                        ),
+                    ))
+                    continue
+                except ConnectionError:
+                    pass
+                except Exception as e:
+                    # Already added, unreadable file, ...: skip just it.
+                    print(f"Couldn't add {torrent_file}: {e!r}")
+                    continue
+            self.jackett.start_torrent_transfer(torrent_file, download_dir)
+
+    def pause(self, torrent_files):
+        for torrent_file in torrent_files:
+            if self._connect():
+                from torrent_client.control import ControlManager
+                from torrent_client.models import TorrentInfo
+                try:
+                    self._execute(partial(
+                        ControlManager.pause,
+                        info_hash=TorrentInfo.from_file(
+                            torrent_file, download_dir=None,
+                        ).download_info.info_hash,
+                    ))
+                    continue
+                except ConnectionError:
+                    pass
+                except Exception as e:
+                    print(f"Couldn't pause {torrent_file}: {e!r}")
+                    continue
+            self.jackett.pause_torrent_transfer(torrent_file)
+
+    def status(self):
+        """
+        Status of every torrent in the daemon, fetched in one round trip.
+        Returns None when the control channel is unavailable.
+        """
+        if not self._connect():
+            return None
+
+        from torrent_client.control import ControlManager
+        try:
+            torrents = self._execute(ControlManager.get_torrents)
+        except ConnectionError:
+            return None
+        return [self._status(torrent_info) for torrent_info in torrents]
+
+    @staticmethod
+    def _status(torrent_info):
+        download_info = torrent_info.download_info
+        if torrent_info.paused:
+            state = "Paused"
+        elif download_info.complete:
+            state = "Uploading"
+        else:
+            state = "Downloading"
+        statistics = download_info.session_statistics
+        total_size = download_info.total_size
+        return TorrentStatus(
+            name=download_info.suggested_name,
+            info_hash=download_info.info_hash.hex(),
+            state=state,
+            download_speed=statistics.download_speed,
+            upload_speed=statistics.upload_speed,
+            size_completed=download_info.downloaded_size,
+            size_total=total_size,
+            progress=100 * download_info.downloaded_size / (total_size or 1),
+        )
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+        if self.loop is not None:
+            self.loop.close()
+            self.loop = None
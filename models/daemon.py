@@ -0,0 +1,192 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import signal
+import time
+import traceback
+
+from .db import engine_options, get_sessionmaker
+from .extraction import ExtractionQueue
+from .fetcher import EpisodeFetcher
+from .tvdb import TVDBAPI
+from utils.config_parser import get_config_values, get_optional_config_values
+from utils.metrics import METRICS, MetricsExporter
+
+MINUTE = 60
+
+job_seconds = METRICS.histogram("daemon_job_seconds",
+                                "Scheduled daemon jobs, by job")
+job_failures = METRICS.counter("daemon_job_failures_total",
+                               "Scheduled daemon jobs that raised, by job")
+
+
+class Daemon:
+    """
+    Runs searching, status polling, extraction and TVDB sync as
+    independent periodic tasks on one asyncio loop, in place of cron.
+
+    The fetcher, TVDB client, Jackett client and pooled HTTP session are
+    created once and reused by every run. Jobs using the shared db
+    session run one at a time on a single worker thread; extraction has
+    its own thread and a session from the same engine, so a long
+    extraction never holds up searches. Intervals are in minutes; 0
+    disables a task.
+
+    SIGINT/SIGTERM stop new runs from being scheduled. Running jobs are
+    left to finish before clients and sessions are closed. Metrics are
+    exported after every run and summarised on shutdown.
+    """
+
+    def __init__(self, fetcher, api=None, extraction_queue=None,
+                 search_interval=60, status_interval=5,
+                 extraction_interval=5, sync_interval=720,
+                 series_ids=None, requeue_missing=False, exporter=None):
+        self.fetcher = fetcher
+        self.exporter = exporter or MetricsExporter(summary=False)
+        self.api = api
+        self.extraction_queue = extraction_queue
+        self.intervals = {
+            "search": search_interval,
+            "status": status_interval,
+            "extraction": extraction_interval if extraction_queue else 0,
+            "sync": sync_interval if api else 0,
+        }
+        self.series_ids = series_ids
+        self.requeue_missing = requeue_missing
+        self.loop = None
+        self.stopping = None
+        self.extractions_queued = None
+
+    @classmethod
+    def from_config(cls, config, series_ids=None, shortened_searches=False,
+                    requeue_missing=False):
+        db_config = get_config_values(config, "db")
+        DBSession = get_sessionmaker(db_config["uri"],
+                                     **engine_options(db_config))
+        session = DBSession()
+        fetcher = EpisodeFetcher(config,
+                                 shortened_searches=shortened_searches,
+                                 session=session)
+        # The daemon's extraction task runs the jobs --status queues.
+        fetcher.extraction_queue.deferred = True
+        extraction_queue = ExtractionQueue.from_config(
+            DBSession(),
+            get_optional_config_values(config, "extraction"),
+        )
+        daemon_config = get_optional_config_values(config, "daemon")
+        return cls(
+            fetcher,
+            api=TVDBAPI(config, session=session),
+            extraction_queue=extraction_queue,
+            search_interval=daemon_config.getfloat("search_interval",
+                                                   fallback=60),
+            status_interval=daemon_config.getfloat("status_interval",
+                                                   fallback=5),
+            extraction_interval=daemon_config.getfloat("extraction_interval",
+                                                       fallback=5),
+            sync_interval=daemon_config.getfloat("sync_interval",
+                                                 fallback=720),
+            series_ids=series_ids,
+            requeue_missing=requeue_missing,
+            exporter=MetricsExporter.from_config(config, job="daemon"),
+        )
+
+    def search(self):
+        self.fetcher.download_all_non_complete_episodes(
+            series_ids=self.series_ids or []
+        )
+
+    def status(self):
+        self.fetcher.check_downloading_torrents(
+            requeue_missing=self.requeue_missing
+        )
+        # Don't wait out the interval for newly completed archives.
+        self.loop.call_soon_threadsafe(self.extractions_queued.set)
+
+    def extract(self):
+        self.extraction_queue.run()
+
+    def sync(self):
+        self.api.login()
+        self.api.add_series_episodes(series_ids=self.series_ids)
+
+    def stop(self):
+        """Stop scheduling runs; safe to call from any thread."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+
+    def _run(self, name, job, session):
+        started = time.monotonic()
+        try:
+            job()
+        except Exception:
+            # Leave the shared session usable for the next run.
+            session.rollback()
+            job_failures.inc(job=name)
+            print(f"{name} failed:")
+            traceback.print_exc()
+        else:
+            print(f"{name} finished in {time.monotonic() - started:.1f}s")
+        finally:
+            job_seconds.observe(time.monotonic() - started, job=name)
+            self.exporter.export()
+
+    async def _wait(self, interval, wake=None):
+        """Sleep `interval` minutes, or until stopping or woken."""
+        events = [self.stopping] + ([wake] if wake else [])
+        waiters = [asyncio.ensure_future(event.wait()) for event in events]
+        await asyncio.wait(waiters, timeout=interval * MINUTE,
+                           return_when=asyncio.FIRST_COMPLETED)
+        for waiter in waiters:
+            waiter.cancel()
+        if wake:
+            wake.clear()
+
+    async def _every(self, name, job, executor, session, wake=None):
+        interval = self.intervals[name]
+        while not self.stopping.is_set():
+            await self.loop.run_in_executor(executor, self._run, name, job,
+                                            session)
+            await self._wait(interval, wake)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.extractions_queued = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(sig, self.stopping.set)
+        self.exporter.start()
+
+        db_thread = ThreadPoolExecutor(max_workers=1)
+        extraction_thread = ThreadPoolExecutor(max_workers=1)
+        session = self.fetcher.session
+        tasks = [
+            ("sync", self.sync, db_thread, session, None),
+            ("search", self.search, db_thread, session, None),
+            ("status", self.status, db_thread, session, None),
+        ]
+        if self.extraction_queue:
+            tasks.append(("extraction", self.extract, extraction_thread,
+                          self.extraction_queue.session,
+                          self.extractions_queued))
+        try:
+            await asyncio.gather(*(
+                self._every(*task) for task in tasks
+                if self.intervals[task[0]]
+            ))
+        finally:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                self.loop.remove_signal_handler(sig)
+            db_thread.shutdown(wait=True)
+            extraction_thread.shutdown(wait=True)
+            self.close()
+        print("Daemon stopped")
+
+    def close(self):
+        self.exporter.finish()
+        self.fetcher.torrent_client.close()
+        self.fetcher.session.close()
+        if self.extraction_queue:
+            self.extraction_queue.session.close()
+
+    def run(self):
+        asyncio.run(self.serve())
@@ -1,15 +1,24 @@
+from contextlib import contextmanager
 from datetime import datetime
-import os
+from functools import partial
 
 from sqlalchemy import (
     Column,
     create_engine,
     DateTime,
+    event,
+    Float,
     ForeignKey,
     Index,
     Integer,
+    MetaData,
     String,
+    Table,
+    func,
+    inspect,
+    select,
 )
+from sqlalchemy.engine.url import make_url
 
 from sqlalchemy.types import Boolean, Date
 from sqlalchemy.ext.declarative import declarative_base
@@ -26,19 +35,16 @@ class Series(Base):
     air_time = Column(String)
     air_days_of_week = Column(String)
     pages = Column(Integer, default=0)
+    last_synced_at = Column(DateTime())
 
 
-class Episode(Base):
-    __tablename__ = "episode"
-
-    series_id = Column(Integer, ForeignKey("series.id"), primary_key=True)
-    id = Column(Integer, primary_key=True)
-    season_number = Column(Integer)
-    episode_number = Column(Integer)
-    name = Column(String)
-    air_date = Column(DateTime())
-    overview = Column(String)
-    series = relationship(Series)
+class EpisodeNames:
+    """
+    Search strings for an episode, from its `series_name`,
+    `season_number` and `episode_number`. Shared by Episode and the
+    column-projected records in models.reads.
+    """
+    __slots__ = ()
 
     @property
     def season_offset(self):
@@ -53,7 +59,7 @@ class Episode(Base):
     def indexed_name(self):
         offset = self.season_offset
         indexed_name = "{name} s{s}e{e}".format(
-            name=self.series.name,
+            name=self.series_name,
             s=offset.get("z_season"),
             e=offset.get("z_episode_number"),
         )
@@ -61,12 +67,12 @@ class Episode(Base):
 
     def split_name(self):
         for i in [":", " "]:
-            if i in self.series.name:
+            if i in self.series_name:
                 return {
                     "delim": i,
-                    "name": self.series.name.split(i),
+                    "name": self.series_name.split(i),
                 }
-        return {"delim": None, "name": [self.series.name]}
+        return {"delim": None, "name": [self.series_name]}
 
     def shortened_indexed_name(self, season=None, episode="episode_number"):
         offset = self.season_offset
@@ -84,6 +90,26 @@ class Episode(Base):
         return indexed_name
 
 
+class Episode(EpisodeNames, Base):
+    __tablename__ = "episode"
+
+    series_id = Column(Integer, ForeignKey("series.id"), primary_key=True)
+    id = Column(Integer, primary_key=True)
+    season_number = Column(Integer)
+    episode_number = Column(Integer)
+    name = Column(String)
+    air_date = Column(DateTime())
+    overview = Column(String)
+    search_attempts = Column(Integer, default=0)
+    last_searched_at = Column(DateTime())
+    next_search_at = Column(DateTime())
+    series = relationship(Series)
+
+    @property
+    def series_name(self):
+        return self.series.name
+
+
 class EpisodeTorrent(Base):
     __tablename__ = "episode_torrent"
     info_hash = Column(String, primary_key=True)
@@ -104,25 +130,325 @@ class SeriesExclusion(Base):
     filename = Column(String)
 
 
+class SearchResultCache(Base):
+    __tablename__ = "search_result_cache"
+
+    query = Column(String, primary_key=True)
+    trackers = Column(String, primary_key=True)
+    results = Column(String)
+    result_count = Column(Integer)
+    created_at = Column(DateTime(), default=datetime.utcnow)
+    accessed_at = Column(DateTime(), default=datetime.utcnow)
+
+
+class ExtractionJob(Base):
+    __tablename__ = "extraction_job"
+
+    id = Column(Integer, primary_key=True)
+    info_hash = Column(String, ForeignKey("episode_torrent.info_hash"))
+    archive_path = Column(String)
+    output_folder = Column(String)
+    status = Column(String, default="queued")
+    backend = Column(String)
+    error = Column(String)
+    created_at = Column(DateTime(), default=datetime.utcnow)
+    started_at = Column(DateTime())
+    finished_at = Column(DateTime())
+    duration = Column(Float)
+    episode_torrent = relationship(EpisodeTorrent)
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
+
+
 Index("idx_episode_torrent_filename", EpisodeTorrent.filename)
+# Covers the NOT EXISTS probe in EpisodeFetcher.non_downloaded_episodes.
+Index(
+    "idx_episode_torrent_episode_id",
+    EpisodeTorrent.episode_id,
+    EpisodeTorrent.complete,
+    EpisodeTorrent.created_at,
+)
+Index("idx_episode_series_id_air_date", Episode.series_id, Episode.air_date)
+Index("idx_episode_air_date", Episode.air_date)
+Index("idx_search_result_cache_accessed_at", SearchResultCache.accessed_at)
+Index("idx_extraction_job_status", ExtractionJob.status)
 
-def get_engine(db_uri):
-    """Creates the db engine"""
+def _set_sqlite_pragmas(busy_timeout, mmap_size, dbapi_connection,
+                        connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers carry on while another process writes; it isn't
+    # available for in-memory databases, which just ignore it.
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout)}")
+    cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+    cursor.close()
 
-    engine = create_engine(db_uri)
-    in_memory = not db_uri.endswith(".db") or db_uri.endswith(".sqlite")
-    if in_memory:
-        Base.metadata.create_all(engine)
-        return engine
+def get_engine(db_uri, busy_timeout=5000, mmap_size=268435456, pool_size=5,
+               max_overflow=10):
+    """
+    Creates the db engine, migrated to the current schema.
 
-    #TODO fix for other db uris.
-    db_path = db_uri[9:]
-    if not os.path.exists(db_path):
-        Base.metadata.create_all(engine)
+    SQLite connections use WAL with synchronous=NORMAL, so concurrent
+    --download and --status runs read while one writes, and wait up to
+    `busy_timeout` ms for the write lock. Other databases get a
+    connection pool of `pool_size` (+ `max_overflow`) connections,
+    checked before use.
+    """
+    if make_url(db_uri).get_backend_name() == "sqlite":
+        engine = create_engine(
+            db_uri,
+            connect_args={"timeout": busy_timeout / 1000},
+        )
+        event.listen(
+            engine,
+            "connect",
+            partial(_set_sqlite_pragmas, busy_timeout, mmap_size),
+        )
+    else:
+        engine = create_engine(
+            db_uri,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=True,
+            pool_recycle=3600,
+        )
+    migrate(engine)
     return engine
 
-def get_session(db_uri):
-    engine = get_engine(db_uri)
+def engine_options(db_config):
+    """get_engine keyword arguments from the [db] config section."""
+    return {
+        "busy_timeout": db_config.getint("busy_timeout", fallback=5000),
+        "mmap_size": db_config.getint("mmap_size", fallback=268435456),
+        "pool_size": db_config.getint("pool_size", fallback=5),
+        "max_overflow": db_config.getint("max_overflow", fallback=10),
+    }
+
+def _schema_v1():
+    """
+    The tables and indexes of schema version 1. Frozen: the models may
+    move on, but later changes go in their own migrations, never here.
+    """
+    metadata = MetaData()
+    Table(
+        "series", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("name", String),
+        Column("air_time", String),
+        Column("air_days_of_week", String),
+        Column("pages", Integer),
+        Column("last_synced_at", DateTime()),
+    )
+    episode = Table(
+        "episode", metadata,
+        Column("series_id", Integer, ForeignKey("series.id"),
+               primary_key=True),
+        Column("id", Integer, primary_key=True),
+        Column("season_number", Integer),
+        Column("episode_number", Integer),
+        Column("name", String),
+        Column("air_date", DateTime()),
+        Column("overview", String),
+        Column("search_attempts", Integer),
+        Column("last_searched_at", DateTime()),
+        Column("next_search_at", DateTime()),
+    )
+    episode_torrent = Table(
+        "episode_torrent", metadata,
+        Column("info_hash", String, primary_key=True),
+        Column("episode_id", Integer, ForeignKey("episode.id")),
+        Column("filename", String),
+        Column("torrent_name", String),
+        Column("archive_file", String),
+        Column("complete", Boolean),
+        Column("created_at", DateTime()),
+        Column("completed_at", DateTime()),
+    )
+    Table(
+        "series_exclusion", metadata,
+        Column("series_id", Integer, ForeignKey("series.id"),
+               primary_key=True),
+        Column("aired_after", DateTime()),
+        Column("filename", String),
+    )
+    search_result_cache = Table(
+        "search_result_cache", metadata,
+        Column("query", String, primary_key=True),
+        Column("trackers", String, primary_key=True),
+        Column("results", String),
+        Column("result_count", Integer),
+        Column("created_at", DateTime()),
+        Column("accessed_at", DateTime()),
+    )
+    extraction_job = Table(
+        "extraction_job", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("info_hash", String, ForeignKey("episode_torrent.info_hash")),
+        Column("archive_path", String),
+        Column("output_folder", String),
+        Column("status", String),
+        Column("backend", String),
+        Column("error", String),
+        Column("created_at", DateTime()),
+        Column("started_at", DateTime()),
+        Column("finished_at", DateTime()),
+        Column("duration", Float),
+    )
+    Table(
+        "schema_version", metadata,
+        Column("version", Integer, primary_key=True),
+    )
+    Index("idx_episode_torrent_filename", episode_torrent.c.filename)
+    Index(
+        "idx_episode_torrent_episode_id",
+        episode_torrent.c.episode_id,
+        episode_torrent.c.complete,
+        episode_torrent.c.created_at,
+    )
+    Index("idx_episode_series_id_air_date",
+          episode.c.series_id, episode.c.air_date)
+    Index("idx_episode_air_date", episode.c.air_date)
+    Index("idx_search_result_cache_accessed_at",
+          search_result_cache.c.accessed_at)
+    Index("idx_extraction_job_status", extraction_job.c.status)
+    return metadata
+
+def _add_missing_columns(connection, metadata):
+    """Add columns introduced after a table was first created."""
+    inspector = inspect(connection)
+    for table in metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute(
+                f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            )
+
+def _add_missing_indexes(connection, metadata):
+    """Create indexes introduced after a table was first created."""
+    inspector = inspect(connection)
+    for table in metadata.sorted_tables:
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+
+def _baseline(connection):
+    """
+    Brings databases from before schema versioning, or new ones, up to
+    the schema as of version 1.
+    """
+    metadata = _schema_v1()
+    metadata.create_all(connection)
+    _add_missing_columns(connection, metadata)
+    _add_missing_indexes(connection, metadata)
+
+# Schema version n is reached by running MIGRATIONS[n - 1]; append new
+# migrations here rather than changing existing ones (or the models'
+# tables in _schema_v1).
+MIGRATIONS = [
+    _baseline,
+]
+
+# Key of the PostgreSQL advisory lock serializing migrations.
+SCHEMA_LOCK = 0x73636865
+
+def _lock_schema(connection):
+    """
+    Take a lock held until the end of the transaction, so processes
+    starting together migrate one at a time. It can't be a row lock on
+    schema_version: a new database has no row (or table) to lock yet.
+    """
+    if connection.dialect.name == "sqlite":
+        # pysqlite only opens a transaction before DML; open one
+        # ourselves that holds the write lock from the start.
+        connection.connection.connection.isolation_level = None
+        connection.execute("BEGIN IMMEDIATE")
+    elif connection.dialect.name == "postgresql":
+        connection.execute(select([func.pg_advisory_xact_lock(SCHEMA_LOCK)]))
+    elif connection.dialect.name == "mysql":
+        # Session-scoped; released by _unlock_schema.
+        connection.execute(select([func.get_lock("schema_version", -1)]))
+    else:
+        raise Exception(
+            f"Schema migrations can't lock {connection.dialect.name} databases"
+        )
+
+def _unlock_schema(connection):
+    if connection.dialect.name == "mysql":
+        connection.execute(select([func.release_lock("schema_version")]))
+
+def schema_version(connection):
+    if not connection.dialect.has_table(connection,
+                                        SchemaVersion.__tablename__):
+        return 0
+    version = connection.execute(
+        SchemaVersion.__table__.select()
+    ).scalar()
+    return version or 0
+
+def migrate(engine):
+    """Run any migrations the database hasn't had yet."""
+    with engine.connect() as connection:
+        if schema_version(connection) == len(MIGRATIONS):
+            return
+        dbapi_connection = connection.connection.connection
+        isolation_level = getattr(dbapi_connection, "isolation_level", None)
+        transaction = connection.begin()
+        try:
+            _lock_schema(connection)
+            version = schema_version(connection)
+            for migration in MIGRATIONS[version:]:
+                migration(connection)
+            table = SchemaVersion.__table__
+            connection.execute(table.delete())
+            connection.execute(table.insert(), version=len(MIGRATIONS))
+            transaction.commit()
+        except Exception:
+            transaction.rollback()
+            raise
+        finally:
+            _unlock_schema(connection)
+            if connection.dialect.name == "sqlite":
+                dbapi_connection.isolation_level = isolation_level
+
+def explain_query_plan(session, query):
+    """SQLite's EXPLAIN QUERY PLAN detail lines for an ORM query."""
+    compiled = query.statement.compile(dialect=session.bind.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    rows = session.connection().execute(
+        "EXPLAIN QUERY PLAN " + str(compiled), *params
+    )
+    return [row[-1] for row in rows]
+
+@contextmanager
+def expire_on_commit_disabled(session):
+    """
+    Keep loaded objects (and their eager-loaded relationships) usable
+    after each commit in the block, instead of refreshing every one of
+    them with its own SELECT on the next attribute access. Only for loops
+    that commit rows they hold, which no one else writes meanwhile.
+    """
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        yield session
+    finally:
+        session.expire_on_commit = expire_on_commit
+
+def get_sessionmaker(db_uri, **engine_options):
+    """Session factory sharing one engine, and its connection pool."""
+    engine = get_engine(db_uri, **engine_options)
     Base.metadata.bind = engine
-    DBSession = sessionmaker(bind=engine)
+    return sessionmaker(bind=engine)
+
+def get_session(db_uri, **engine_options):
+    DBSession = get_sessionmaker(db_uri, **engine_options)
     return DBSession()
@@ -0,0 +1,205 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from .db import ExtractionJob, engine_options, get_session
+from utils.archives import extract
+from utils.config_parser import get_config_values, get_optional_config_values
+from utils.metrics import METRICS
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+APP = os.path.join(os.path.split(os.path.abspath(__file__))[0], "..", "app.py")
+
+extractions = METRICS.counter("extractions_total",
+                              "Finished extractions, by status and backend")
+extraction_seconds = METRICS.histogram(
+    "extraction_seconds", "Archive extraction time, by backend",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+extraction_queue_depth = METRICS.gauge("extraction_queue_depth",
+                                       "Extraction jobs waiting to run")
+
+
+def _lower_priority(niceness, ionice):
+    """Pool initializer; 7z subprocesses inherit the worker's priority."""
+    if niceness:
+        os.nice(niceness)
+    if ionice and shutil.which("ionice"):
+        subprocess.run(["ionice", "-c", "3", "-p", str(os.getpid())])
+
+
+def run_extraction(archive_path, output_folder, backend="auto"):
+    """
+    Runs in a pool worker process.
+    Returns (error or None, duration in seconds, backend used).
+    Any exception is the job's error, so one bad archive can't stop the
+    rest of the queue.
+    """
+    started = time.monotonic()
+    error = None
+    try:
+        backend = extract(archive_path, output_folder, backend=backend)
+    except Exception as e:
+        error = str(e) or repr(e)
+    return (error, time.monotonic() - started, backend)
+
+
+class ExtractionQueue:
+    """
+    Archives of completed torrents are queued as ExtractionJob rows and
+    extracted by a process pool of `workers`, optionally under `nice`
+    and idle-class `ionice`, using the utils.archives `backend`.
+
+    With `background`, queueing spawns a detached `app.py --extract`
+    worker, reading the same `config` file, so `--status` returns without
+    waiting on extractions. A
+    `deferred` queue leaves jobs for whoever calls run(), e.g. the daemon.
+    Jobs left running for longer than `job_timeout` minutes, e.g. by a
+    worker that died, are queued again.
+    """
+
+    def __init__(self, session, workers=2, niceness=10, ionice=True,
+                 background=True, job_timeout=120, backend="auto",
+                 deferred=False, config=None):
+        self.session = session
+        self.config = config
+        self.backend = backend
+        self.deferred = deferred
+        self.workers = workers
+        self.niceness = niceness
+        self.ionice = ionice
+        self.background = background
+        self.job_timeout = timedelta(minutes=job_timeout)
+
+    @classmethod
+    def from_config(cls, session, config_section, config=None):
+        return cls(
+            session,
+            config=config,
+            workers=config_section.getint("workers", fallback=2),
+            niceness=config_section.getint("niceness", fallback=10),
+            ionice=config_section.getboolean("ionice", fallback=True),
+            background=config_section.getboolean("background", fallback=True),
+            job_timeout=config_section.getint("job_timeout", fallback=120),
+            backend=config_section.get("backend", fallback="auto"),
+        )
+
+    @classmethod
+    def from_config_file(cls, config):
+        """
+        A queue on its own session, for `app.py --extract`, which needs
+        neither Jackett nor TVDB.
+        """
+        db_config = get_config_values(config, "db")
+        return cls.from_config(
+            get_session(db_config["uri"], **engine_options(db_config)),
+            get_optional_config_values(config, "extraction"),
+            config=config,
+        )
+
+    def enqueue(self, episode_torrent, archive_path, output_folder):
+        job = ExtractionJob(
+            info_hash=episode_torrent.info_hash,
+            archive_path=archive_path,
+            output_folder=output_folder,
+            status=QUEUED,
+        )
+        self.session.add(job)
+        return job
+
+    def start(self):
+        """Process queued jobs, in the background if configured."""
+        if self.deferred:
+            return
+        if self.background:
+            command = [sys.executable, APP, "--extract"]
+            if self.config and self.config.endswith(".ini"):
+                # The worker shouldn't depend on our working directory.
+                command += ["--config", os.path.abspath(self.config)]
+            subprocess.Popen(
+                command,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        else:
+            self.run()
+
+    def _requeue_stale(self):
+        stale = datetime.utcnow() - self.job_timeout
+        (
+            self.session.query(ExtractionJob)
+            .filter(ExtractionJob.status == RUNNING)
+            .filter(ExtractionJob.started_at < stale)
+        ).update({"status": QUEUED}, synchronize_session=False)
+        self.session.commit()
+
+    def _claim(self, job_id):
+        """Mark a queued job running; False if another worker got it."""
+        claimed = (
+            self.session.query(ExtractionJob)
+            .filter(ExtractionJob.id == job_id)
+            .filter(ExtractionJob.status == QUEUED)
+        ).update(
+            {"status": RUNNING, "started_at": datetime.utcnow()},
+            synchronize_session=False,
+        )
+        self.session.commit()
+        return claimed == 1
+
+    def _finish(self, job_id, error, duration, backend):
+        job = self.session.query(ExtractionJob).get(job_id)
+        job.status = FAILED if error else DONE
+        job.error = error
+        job.duration = duration
+        job.backend = backend
+        job.finished_at = datetime.utcnow()
+        self.session.commit()
+        extractions.inc(status=job.status, backend=backend)
+        if not error:
+            extraction_seconds.observe(duration, backend=backend)
+        if error:
+            print(f"Error Extracting {job.archive_path}")
+            print(error)
+        else:
+            print(f"Extracted {job.archive_path} with {backend} "
+                  f"in {duration:.1f}s")
+
+    def run(self):
+        """Extract queued jobs until none are left."""
+        self._requeue_stale()
+        with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_lower_priority,
+                initargs=(self.niceness, self.ionice)) as pool:
+            while True:
+                queued = (
+                    self.session.query(ExtractionJob.id,
+                                       ExtractionJob.archive_path,
+                                       ExtractionJob.output_folder)
+                    .filter(ExtractionJob.status == QUEUED)
+                    .order_by(ExtractionJob.id)
+                ).all()
+                extraction_queue_depth.set(len(queued))
+                futures = {
+                    pool.submit(run_extraction, archive_path,
+                                output_folder, self.backend): job_id
+                    for job_id, archive_path, output_folder in queued
+                    if self._claim(job_id)
+                }
+                if not futures:
+                    return
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # The worker itself died, e.g. BrokenProcessPool.
+                        result = (repr(e), 0.0, self.backend)
+                    self._finish(futures[future], *result)
@@ -1,154 +1,527 @@
 from datetime import datetime, timedelta
 import os
-import re
-import subprocess
-import sys
-import time
 
-from sqlalchemy import and_, not_, or_
-from string import digits
+from sqlalchemy import and_, bindparam, exists, not_, or_
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
 
+from .bittorrent import BitTorrentClient
 from .db import (
+    engine_options,
+    expire_on_commit_disabled,
     get_session,
     Episode,
 	EpisodeTorrent,
     Series,
     SeriesExclusion,
 )
+from .extraction import ExtractionQueue
 from .jackett import Jackett
-from utils.config_parser import get_config_values
-from utils.decorators import must_be_set
+from .reads import EpisodeRecord
+from .ranking import ResultRanker
+from .schedule import SearchSchedule
+from .search_cache import SearchCache
+from .status import parse_statuses
+from exceptions import SearchResultMissingFile
+from utils.archives import first_volume
+from utils.bencode import torrent_metadata
+from utils.config_parser import get_config_values, get_optional_config_values
+from utils.http import get_http_session
+from utils.metrics import METRICS
+from utils.pipeline import Pipeline, Stage
+
+
+cache_lookups = METRICS.counter("search_cache_lookups_total",
+                                "Search cache lookups, by result")
+grabs = METRICS.counter("torrents_grabbed_total", "Torrents added")
+search_failures = METRICS.counter(
+    "episode_search_failures_total",
+    "Episodes searched without a usable result, by reason")
+completions = METRICS.counter("torrents_completed_total",
+                              "Torrents marked complete")
+active_torrents = METRICS.gauge("active_torrents",
+                                "Torrents not yet complete")
+missing_torrents = METRICS.gauge(
+    "missing_torrents", "Active torrents the bit-torrent client doesn't have")
+search_queue_depth = METRICS.gauge("search_queue_depth",
+                                   "Episodes due a search this run")
+select_seconds = METRICS.histogram("result_select_seconds",
+                                   "Ranking and picking a search result")
+parse_seconds = METRICS.histogram("torrent_parse_seconds",
+                                  ".torrent metadata parsing")
+
+
+class EpisodeDownload:
+    """
+    Plain values carried through the download pipeline for one episode,
+    so pipeline threads never touch ORM objects or the session.
+    """
+    __slots__ = (
+        "episode_id",
+        "series_id",
+        "series_name",
+        "queries",
+        "names",
+        "searched",
+        "search_results",
+        "result",
+        "torrent_file",
+        "torrent_data",
+        "torrent_info",
+        "error",
+    )
+
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            setattr(self, field, fields.get(field))
+
+
+def _pipeline_stage(func):
+    """
+    Run `func` on downloads that haven't failed yet. Errors are kept on
+    the download so the episode is still recorded as a failed attempt.
+    """
+    def stage(self, download, *args):
+        if download.error is None:
+            try:
+                func(self, download, *args)
+            except Exception as e:
+                download.error = repr(e)
+        return download
+    return stage
+
 
 class EpisodeFetcher:
 
     def _get_jackett(self):
         jackett_config = get_config_values(self.config, "jackett")
-        return Jackett(jackett_config)
+        return Jackett(jackett_config, get_http_session(self.config))
 
     def _get_session(self):
         db_config = get_config_values(self.config, "db")
-        return get_session(db_config["uri"])
+        return get_session(db_config["uri"], **engine_options(db_config))
 
-    def __init__(self, config, shortened_searches=False):
+    def __init__(self, config, shortened_searches=False, session=None):
         self.config = config
         self.shortened_searches = shortened_searches
-        self.session = self._get_session()
+        self._known_filenames = None
+        self._known_info_hashes = None
+        self._episode_names = {}
+        self._attempts = []
+        self._grabs = []
+        self._rankers = {}
+        self.session = session or self._get_session()
         self.jackett = self._get_jackett()
+        self.torrent_client = BitTorrentClient(self.jackett)
+        self.search_cache = SearchCache.from_config(self.session,
+                                                    self.jackett.config)
+        self.schedule = SearchSchedule.from_config(
+            get_optional_config_values(self.config, "schedule")
+        )
+        self.extraction_queue = ExtractionQueue.from_config(
+            self.session,
+            get_optional_config_values(self.config, "extraction"),
+            config=self.config,
+        )
+        pipeline_config = get_optional_config_values(self.config, "pipeline")
+        self.fetch_workers = pipeline_config.getint("fetch_workers",
+                                                    fallback=4)
+        self.parse_workers = pipeline_config.getint("parse_workers",
+                                                    fallback=2)
+        self.queue_size = pipeline_config.getint("queue_size", fallback=16)
+        self.save_every = pipeline_config.getint("save_every", fallback=20)
 
     def non_downloaded_episodes(self, series_ids=[]):
-        completed_cte = (
-            self.session.query(EpisodeTorrent.episode_id.label("episode_id"))
-            .filter(EpisodeTorrent.complete)
-            .group_by(EpisodeTorrent.episode_id)
-        ).cte("completed_cte")
-
+        """
+        Episodes without a completed torrent, or a torrent added within
+        the last hour. The torrent check is a correlated NOT EXISTS
+        answered from idx_episode_torrent_episode_id alone.
+        """
         one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-        recently_added_cte = (
-            self.session.query(EpisodeTorrent.episode_id.label("episode_id"))
-            .filter(EpisodeTorrent.created_at >= one_hour_ago)
-            .group_by(EpisodeTorrent.episode_id)
-        ).cte("recently_added_cte")
-
-        is_null_clause = and_(
-            completed_cte.c.episode_id.is_(None),
-            recently_added_cte.c.episode_id.is_(None),
-        )
+        has_torrent = exists([EpisodeTorrent.episode_id]).where(and_(
+            EpisodeTorrent.episode_id == Episode.id,
+            or_(
+                EpisodeTorrent.complete,
+                EpisodeTorrent.created_at >= one_hour_ago,
+            ),
+        ))
         query = (
-			self.session.query(Episode)
-			.outerjoin(completed_cte, completed_cte.c.episode_id == Episode.id)
-            .outerjoin(recently_added_cte, recently_added_cte.c.episode_id == Episode.id)
+            self.session.query(Episode)
             .outerjoin(SeriesExclusion, Episode.series_id ==
                        SeriesExclusion.series_id)
-			.filter(is_null_clause)
+            .filter(~has_torrent)
             .filter(or_(
                 SeriesExclusion.series_id.is_(None),
                 Episode.air_date > SeriesExclusion.aired_after)
             )
-		)
+        )
         if series_ids:
             query = query.filter(Episode.series_id.in_(series_ids))
         return query
 
+    def search_queue_records(self, series_ids=[]):
+        """
+        Non downloaded episodes due a search, in priority order, as
+        EpisodeRecords, read in one column-projected query with the
+        series names joined in for the search strings.
+        """
+        query = EpisodeRecord.project(
+            self.non_downloaded_episodes(series_ids=series_ids)
+        )
+        return EpisodeRecord.fetch(self.session, self.schedule.apply(query))
+
     def _start_transfer(self, torrent_file, series_name):
-        series_folder = self.jackett._series_folder(series_name)
-        self.jackett.start_torrent_transfer(torrent_file, series_folder)
+        self._start_transfers([(torrent_file, series_name)])
+
+    def _start_transfers(self, transfers):
+        """Start every (torrent_file, series_name) transfer in one batch."""
+        self.torrent_client.add(
+            (torrent_file, self.jackett._series_folder(series_name))
+            for torrent_file, series_name in transfers
+        )
 
     def _best_result(self, search_results, excluded):
+        """
+        First search result whose filename is neither excluded nor
+        already downloaded, and whose info hash isn't already known.
+        Purely in-memory; see known_filenames.
+        """
+        known = self.known_filenames
+        known_hashes = self.known_info_hashes
         best_result = None
         for search in search_results:
-            search_filename = self.jackett.get_torrent_file_from_search(search)
-            if search_filename in excluded:
+            # Results Jackett gives an info hash for are deduped before
+            # their .torrent is fetched.
+            info_hash = self.jackett.get_info_hash_from_search(search)
+            if info_hash in known_hashes:
                 continue
-            already_downloaded = (
-                self.session.query(EpisodeTorrent)
-                .filter(EpisodeTorrent.filename == search_filename)
-            ).first()
-            if already_downloaded:
+            # bit-torrent can only start transfers from a .torrent file.
+            if not search.get("Link"):
+                continue
+            try:
+                search_filename = self.jackett.get_torrent_file_from_search(
+                    search
+                )
+            except SearchResultMissingFile:
+                if info_hash is None:
+                    continue
+                search_filename = info_hash
+            if search_filename in excluded or search_filename in known:
                 continue
             best_result = search
             best_result["filename"] = search_filename
+            best_result["info_hash"] = info_hash
             break
         return best_result
 
+    def _load_known(self):
+        query = self.session.query(EpisodeTorrent.filename,
+                                   EpisodeTorrent.info_hash)
+        self._known_filenames = set()
+        self._known_info_hashes = set()
+        for filename, info_hash in query:
+            if filename is not None:
+                self._known_filenames.add(filename)
+            self._known_info_hashes.add(info_hash)
+
+    @property
+    def known_filenames(self):
+        """
+        Filenames of every torrent already added, loaded once and kept
+        current by _add_known_filename as new results are picked.
+        """
+        if self._known_filenames is None:
+            self._load_known()
+        return self._known_filenames
+
+    @property
+    def known_info_hashes(self):
+        """Info hashes of every torrent already added; see known_filenames."""
+        if self._known_info_hashes is None:
+            self._load_known()
+        return self._known_info_hashes
+
+    def _add_known_filename(self, filename, info_hash=None):
+        if self._known_filenames is not None:
+            self._known_filenames.add(filename)
+        if info_hash and self._known_info_hashes is not None:
+            self._known_info_hashes.add(info_hash)
+
     @property
     def excluded_filenames(self):
         query = (
             self.session.query(SeriesExclusion.filename)
             .filter(not_(SeriesExclusion.filename.is_(None)))
         )
-        return [filename for filename in query]
+        return {filename for (filename,) in query}
 
-    def search(self, ep):
-        queries = [ep.indexed_name]
+    def episode_names(self, ep):
+        """
+        `ep`'s indexed and shortened names, computed once per run for
+        both its search queries and ranking.
+        """
+        key = (ep.series_id, ep.id)
+        names = self._episode_names.get(key)
+        if names is None:
+            names = self._episode_names[key] = [
+                ep.indexed_name,
+                ep.shortened_indexed_name(episode="z_episode_number"),
+            ]
+        return names
+
+    def search_queries(self, ep):
+        indexed_name, shortened_name = self.episode_names(ep)
         if self.shortened_searches:
-            queries.append(ep.shortened_indexed_name(episode="z_episode_number"))
+            return [indexed_name, shortened_name]
+        return [indexed_name]
 
+    def _search_queries(self, queries):
+        """
+        Search Jackett for each query until one returns results.
+        Returns the (query, search_results) pairs that were searched.
+        """
+        searched = []
         for search_query in queries:
             print (f"Attempting to find torrents for: {search_query}")
             search_results = self.jackett.search(search_query)
             #print(search_results)
+            searched.append((search_query, search_results))
             if search_results:
-                return search_results
-        return []
+                break
+        return searched
+
+    def _cached_search(self, queries):
+        """
+        Consult the search cache for `queries`, in order.
+        Returns (cached_results, queries that still need searching).
+        """
+        for i, search_query in enumerate(queries):
+            search_results = self.search_cache.get(search_query,
+                                                   self.jackett.trackers)
+            if search_results is None:
+                cache_lookups.inc(result="miss")
+                return [], queries[i:]
+            cache_lookups.inc(result="hit")
+            if search_results:
+                return search_results, []
+        return [], []
+
+    def _store_searches(self, searched):
+        for search_query, search_results in searched:
+            self.search_cache.set(search_query, self.jackett.trackers,
+                                  search_results)
+        return searched[-1][1] if searched else []
+
+    def search(self, ep):
+        search_results, queries = self._cached_search(self.search_queries(ep))
+        if queries:
+            search_results = self._store_searches(self._search_queries(queries))
+        self.session.commit()
+        return search_results
 
     def download_all_non_complete_episodes(self, series_ids=[],
                                            pause_transfer=False):
-        self._append_path()
         excluded = self.excluded_filenames
-        for ep in self.non_downloaded_episodes(series_ids=series_ids):
-            search_results = self.search(ep)
-            if not search_results:
+        # Reload known filenames and info hashes once per run.
+        self._known_filenames = None
+        self._known_info_hashes = None
+        self._episode_names = {}
+        episodes = self.search_queue_records(series_ids=series_ids)
+        search_queue_depth.set(len(episodes))
+        transfers = []
+        try:
+            self._download_episodes(episodes, excluded, transfers)
+        finally:
+            # Persist whatever was recorded before a failure.
+            self._save_downloads()
+        # Only after a clean run; torrents grabbed by a run that failed
+        # partway are left to `--status --requeue-missing`.
+        if not pause_transfer:
+            self._start_transfers(transfers)
+
+    def _download_episodes(self, episodes, excluded, transfers):
+        """
+        Run `episodes` through the download pipeline:
+        search -> select -> fetch .torrent -> parse, each stage with its
+        own workers and a bounded queue between stages, so a slow
+        .torrent download never holds up searches for other episodes.
+
+        Cache lookups, and every db write, happen here on the calling
+        thread as episodes come out of the pipeline. Cache entries for the
+        whole queue are loaded up front, and search attempts (recorded on
+        `episodes`, EpisodeRecords or Episodes), grabs and cache entries
+        are written in batches of `save_every` episodes, so a run issues
+        the same statements per batch however many episodes it searches,
+        and a killed run loses at most one batch of grabs.
+        """
+        by_id = {}
+        downloads = []
+        self.search_cache.preload(
+            [query for ep in episodes for query in self.search_queries(ep)],
+            self.jackett.trackers,
+        )
+        for ep in episodes:
+            search_results, queries = self._cached_search(
+                self.search_queries(ep)
+            )
+            by_id[ep.id] = ep
+            downloads.append(EpisodeDownload(
+                episode_id=ep.id,
+                series_id=ep.series_id,
+                series_name=ep.series_name,
+                queries=queries,
+                names=self.episode_names(ep),
+                search_results=search_results,
+            ))
+            # Warm the ranker cache; rankers read the config.
+            self._ranker(ep.series_id)
+        # Load before the select stage reads them off this thread.
+        recorded = set(self.known_info_hashes)
+
+        pipeline = Pipeline([
+            Stage("search", self._search_stage, self.jackett.search_workers),
+            Stage("select", lambda download: self._select_stage(download,
+                                                                excluded)),
+            Stage("fetch", self._fetch_stage, self.fetch_workers),
+            Stage("parse", self._parse_stage, self.parse_workers),
+        ], queue_size=self.queue_size)
+
+        for download in pipeline.run(downloads):
+            ep = by_id[download.episode_id]
+            name = download.names[0]
+            if download.searched:
+                self._store_searches(download.searched)
+            if download.error:
+                print(f"Error downloading {name}: {download.error}")
+            if download.torrent_info is None:
+                search_failures.inc(reason=self._failure_reason(download))
+                self._record_attempt(ep)
                 continue
 
-            search_results = self.sort_search_results(search_results)
-            best_result = self._best_result(search_results, excluded)
-            if not best_result:
+            torrent_info = download.torrent_info
+            if torrent_info["info_hash"] in recorded:
+                # A result Jackett gave no info hash for, already added.
+                print(f"Already downloaded: {name}: "
+                      f"{torrent_info['suggested_name']}")
+                search_failures.inc(reason="duplicate")
+                self._record_attempt(ep)
                 continue
-            torrent_file = self.jackett.download_torrent_file(ep.series.name,
-                                                              best_result)
-            torrent_info = self._torrent_info(torrent_file)
+            recorded.add(torrent_info["info_hash"])
             episode_torrent = EpisodeTorrent(
                 episode_id=ep.id,
-                filename=best_result["filename"],
+                filename=download.result["filename"],
                 torrent_name=torrent_info["suggested_name"],
                 archive_file=torrent_info["archive_file"],
                 info_hash=torrent_info["info_hash"],
             )
-            self.session.add(episode_torrent)
-            self.session.commit()
+            self._record_attempt(ep, success=True)
+            self._grabs.append(episode_torrent)
+            grabs.inc()
+
+            print(f"Downloaded: {name}: {torrent_info['suggested_name']}")
+            transfers.append((download.torrent_file, download.series_name))
+            if len(self._attempts) >= self.save_every:
+                # The .torrent is already on disk; don't hold its grab
+                # in memory for the rest of the run.
+                self._save_downloads()
+
+        self._save_downloads()
+        self.search_cache.evict()
+        self.session.commit()
+        for line in pipeline.report():
+            print(line)
+
+    def _record_attempt(self, ep, success=False):
+        if success:
+            self.schedule.record_success(ep)
+        else:
+            self.schedule.record_failure(ep)
+        self._attempts.append(ep)
+
+    def _save_downloads(self):
+        """Write the recorded attempts, grabs and cache entries."""
+        self._save_attempts()
+        self.session.add_all(self._grabs)
+        self._grabs = []
+        self.session.commit()
 
-            print(f"Downloaded: {ep.indexed_name}: {torrent_info['suggested_name']}")
-            if pause_transfer is True:
-                continue
-            self._start_transfer(torrent_file, ep.series.name)
-            time.sleep(15)
+    def _save_attempts(self):
+        """Write recorded search attempts in one executemany UPDATE."""
+        if not self._attempts:
+            return
+        table = Episode.__table__
+        self.session.execute(
+            table.update().where(and_(
+                table.c.series_id == bindparam("episode_series_id"),
+                table.c.id == bindparam("episode_id"),
+            )),
+            [
+                {
+                    "episode_series_id": ep.series_id,
+                    "episode_id": ep.id,
+                    "search_attempts": ep.search_attempts,
+                    "last_searched_at": ep.last_searched_at,
+                    "next_search_at": ep.next_search_at,
+                }
+                for ep in self._attempts
+            ],
+        )
+        self._attempts = []
+
+    @staticmethod
+    def _failure_reason(download):
+        if download.error:
+            return "error"
+        if not download.search_results:
+            return "no_results"
+        return "no_new_result"
+
+    @_pipeline_stage
+    def _search_stage(self, download):
+        if download.queries:
+            download.searched = self._search_queries(download.queries)
+            download.search_results = download.searched[-1][1]
+
+    @_pipeline_stage
+    def _select_stage(self, download, excluded):
+        """
+        Pick the best result. Runs on a single worker, which claims the
+        filename straight away so no later episode can pick it too.
+        """
+        if not download.search_results:
+            return
+        with select_seconds.time():
+            ranked = self._ranker(download.series_id).rank(
+                download.search_results, download.names
+            )
+            download.result = self._best_result(ranked, excluded)
+        if download.result:
+            self._add_known_filename(download.result["filename"],
+                                     download.result["info_hash"])
+
+    @_pipeline_stage
+    def _fetch_stage(self, download):
+        if download.result:
+            download.torrent_file, download.torrent_data = (
+                self.jackett.download_torrent(download.series_name,
+                                              download.result)
+            )
+
+    @_pipeline_stage
+    def _parse_stage(self, download):
+        if download.torrent_data:
+            with parse_seconds.time():
+                download.torrent_info = self._torrent_info(
+                    download.torrent_data
+                )
+            download.torrent_data = None
 
     def download_specific_episode(self, episode, pause=False):
         search_results = self.search(episode)
         if not search_results:
             return
         series_name = episode.series.name
-        search_results = self.sort_search_results(search_results)
+        search_results = self.sort_search_results(search_results, episode)
         torrent_file = self.jackett.download_torrent_file(series_name,
                                                           best_result)
         torrent_info = self._torrent_info(torrent_file)
@@ -163,97 +536,145 @@ class EpisodeFetcher:
         self.session.add(episode_torrent)
         self.session.commit()
         if pause:
-            #XXX wut
-            import time
-            time.sleep(10)
-            self.jackett.pause_torrent_transfer(torrent_file)
+            self.torrent_client.pause([torrent_file])
         return torrent_name
 
 
     def current_active_episode_torrents(self):
         query = (
             self.session.query(EpisodeTorrent)
+            .options(joinedload(EpisodeTorrent.episode)
+                     .joinedload(Episode.series))
             .filter(not_(EpisodeTorrent.complete))
         )
         return query
 
-    def check_downloading_torrents(self):
+    def check_downloading_torrents(self, requeue_missing=False):
         """
         Hit the bittorrent cli for status and get results
         for all active torrents.
-        """
-        status_stdout, status_stderr = self.jackett.bittorrent_cli_status()
-        statuses = self.parse_status_string(status_stdout)
-
-        for ep_torrent in self.current_active_episode_torrents():
-            for status in statuses:
-                if ep_torrent.info_hash == status["ID"]:
-                    self.process_running_torrent(ep_torrent, status)
-
-    def sort_search_results(self, search_results):
-        return sorted(search_results, key=lambda x: x["Seeders"], reverse=True)
 
-    def _process_status_line(self, line, current_status, statuses):
-        _digits = lambda x: re.findall(r'[\d\.]+', x)[0]
-        P = "Progress"
-
-        line_dict = {
-            line.split(":")[0]: line.split(":")[1].strip()
+        Statuses are indexed by info hash and completed torrents are
+        marked in a single transaction. Active torrents the client doesn't
+        know about, e.g. all of them after it lost its session, are
+        reported, re-added from their .torrent file when
+        `requeue_missing`, and returned.
+        """
+        statuses = self.torrent_statuses()
+        if statuses is None:
+            print("Can't get torrent statuses; is bit-torrent running?")
+            return []
+        statuses = {
+            status.info_hash: status
+            for status in statuses
+            if status.info_hash
         }
-        if P in line_dict:
-            # Convert to number
-            line_dict[P] = _digits(line_dict[P])
 
-        # Matching keys, update current_status's
-        if not current_status.keys().isdisjoint(line_dict.keys()):
-            current_status.update(line_dict)
+        completed = []
+        missing = []
+        active = self.current_active_episode_torrents().all()
+        for ep_torrent in active:
+            status = statuses.get(ep_torrent.info_hash)
+            if status is None:
+                missing.append(ep_torrent)
+            elif status.complete:
+                completed.append(ep_torrent)
+            else:
+                print("Not complete:", status)
+
+        self._mark_complete(completed)
+        completions.inc(len(completed))
+        active_torrents.set(len(active) - len(completed))
+        missing_torrents.set(len(missing))
+        archives = [t for t in completed if t.archive_file]
+        for ep_torrent in archives:
+            self.extract_archive(ep_torrent)
+        if archives:
+            self.session.commit()
+            self.extraction_queue.start()
 
-        # Final line in the `status`.
-        if P in line_dict:
-            statuses.append(current_status)
-            current_status = current_status.fromkeys(current_status)
+        for ep_torrent in missing:
+            print(f"Missing from bit-torrent: {ep_torrent.torrent_name} "
+                  f"({ep_torrent.info_hash})")
+        if requeue_missing:
+            self._requeue(missing)
+        return missing
 
-        return (current_status, statuses)
+    def _mark_complete(self, episode_torrents):
+        """
+        Mark `episode_torrents` complete in bulk, updating the loaded
+        objects in place rather than expiring them, so their episodes
+        and series stay loaded for extraction and requeueing.
+        """
+        completed_at = datetime.utcnow()
+        info_hashes = [t.info_hash for t in episode_torrents]
+        # Chunked to stay under SQLite's bound parameter limit.
+        for i in range(0, len(info_hashes), 500):
+            (
+                self.session.query(EpisodeTorrent)
+                .filter(EpisodeTorrent.info_hash.in_(info_hashes[i:i + 500]))
+            ).update(
+                {"complete": True, "completed_at": completed_at},
+                synchronize_session=False,
+            )
+        for episode_torrent in episode_torrents:
+            set_committed_value(episode_torrent, "complete", True)
+            set_committed_value(episode_torrent, "completed_at",
+                                completed_at)
+        with expire_on_commit_disabled(self.session):
+            self.session.commit()
 
-    def parse_status_string(self, status_string):
-        if isinstance(status_string, bytes):
-            status_string = status_string.decode()
-
-        statuses = []
-        status_keys = [
-            "Name",
-            "ID",
-            "State",
-            "Progress",
-        ]
-        current_status = dict.fromkeys(status_keys)
-        for line in status_string.split("\n"):
-            if len(line) < 2:
-                continue
-            current_status, statuses = self._process_status_line(
-                line,
-                current_status,
-                statuses
+    def _requeue(self, episode_torrents):
+        """Re-add torrents whose .torrent file is still on disk."""
+        transfers = []
+        for ep_torrent in episode_torrents:
+            series_name = ep_torrent.episode.series.name
+            torrent_file = self.jackett.output_torrent_file(
+                series_name, ep_torrent.filename or ""
             )
+            if not ep_torrent.filename or not os.path.exists(torrent_file):
+                print(f"Cannot requeue {ep_torrent.info_hash}: "
+                      ".torrent file not found")
+                continue
+            transfers.append((torrent_file, series_name))
+        self._start_transfers(transfers)
+
+    def _ranker(self, series_id):
+        if series_id not in self._rankers:
+            self._rankers[series_id] = ResultRanker.from_config(self.config,
+                                                                series_id)
+        return self._rankers[series_id]
 
+    def torrent_statuses(self):
+        """
+        Statuses of every torrent in bit-torrent, or None when neither
+        its control channel nor torrent_cli.py can reach it.
+        """
+        statuses = self.torrent_client.status()
+        if statuses is None:
+            status_stdout, status_stderr = self.jackett.bittorrent_cli_status()
+            if status_stdout is None:
+                return None
+            statuses = self.parse_status_string(status_stdout)
         return statuses
 
-    def process_running_torrent(self, episode_torrent, status):
-        # Torrent not complete. Nothing to do.
-        if float(status["Progress"]) < 100:
-            print("Not complete:", status)
-            return
-        episode_torrent.complete = True
-        episode_torrent.completed_at = datetime.utcnow()
-        self.session.commit()
+    def sort_search_results(self, search_results, ep=None):
+        """
+        Rank search results best first, using the [ranking] options for
+        `ep`'s series. Results the ranker rejects are dropped.
+        """
+        if ep is None:
+            return self._ranker(None).rank(search_results)
+        return self._ranker(ep.series_id).rank(search_results,
+                                               self.episode_names(ep))
 
-        if episode_torrent.archive_file:
-            self.extract_archive(episode_torrent)
+    def parse_status_string(self, status_string):
+        return list(parse_statuses(status_string))
 
     def extract_archive(self, episode_torrent):
         """
-        Extract the completed episode_torrent
-        Using subprocess 7zip.
+        Queue extraction of the completed episode_torrent's archive.
+        Jobs are run by the extraction queue's process pool.
         """
         series_folder = (
             self.jackett._series_folder(episode_torrent.episode.series.name)
@@ -262,70 +683,20 @@ class EpisodeFetcher:
             series_folder,
             episode_torrent.archive_file,
         )
-        stdout, stderr = self._7zip_subprocess(archive_path, series_folder)
-        if stderr:
-            print(f"Error Extracting {episode_torrent.archive_file}")
-            print(stderr.decode())
-
-    def _7zip_subprocess(self, archive_path, output_folder):
-        # 7z is dumb no space
-        output_switch = "-o" + output_folder
-        Popen_args = [
-            "7z",
-            "x",
-            archive_path,
-            output_switch,
-        ]
-        _7zip_process = subprocess.Popen(Popen_args,
-                                      stdout=subprocess.PIPE,
-                                      stderr=subprocess.PIPE)
-        stdout, stderr = _7zip_process.communicate()
-        return (stdout, stderr)
-
-    @must_be_set("path_appended")
-    def _torrent_info(self, torrent_filename, download_dir=None):
-        from torrent_client.models import TorrentInfo
-        torrent_info = TorrentInfo.from_file(torrent_filename,
-                                             download_dir=download_dir)
-
-        torrent_info = torrent_info.download_info
+        return self.extraction_queue.enqueue(episode_torrent, archive_path,
+                                             series_folder)
+
+    def _torrent_info(self, torrent):
+        """
+        Name, archive and info hash of a .torrent, given its path or its
+        contents.
+        """
+        if isinstance(torrent, str):
+            with open(torrent, "rb") as f:
+                torrent = f.read()
+        metadata = torrent_metadata(torrent)
         return {
-            "suggested_name": torrent_info.suggested_name,
-            "archive_file": self._check_archive(torrent_info.file_tree),
-            "info_hash": torrent_info.info_hash.hex(),
+            "suggested_name": metadata.name,
+            "archive_file": first_volume(metadata.top_level_names),
+            "info_hash": metadata.info_hash,
         }
-
-    def _check_archive(self, file_tree):
-        def _min_part(min_file, min_part, filename):
-            requires = ["rar", "zip", "7z"]
-            filetype = filename.split(".")[-1].lower()
-            if filetype in requires:
-                return (filename, -1)
-
-            fn = "".join([f for f in filetype if f in digits])
-            if fn:
-                fn = int(fn)
-                if min_file is None or fn < min_part:
-                    min_file = filename
-                    min_part = fn
-            return (min_file, min_part)
-
-        min_file = None
-        min_part = None
-        for filename in file_tree.keys():
-            min_file, min_part = _min_part(min_file, min_part, filename)
-            if min_part is not None and min_part < 0:
-                return filename
-
-        return min_file
-
-    def _append_path(self):
-        sys.path.append(
-            os.path.join(
-                os.path.split(os.path.abspath(__file__))[0],
-                "..",
-                "vendor",
-                "bit-torrent",
-            )
-        )
-        self.path_appended = True
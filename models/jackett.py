@@ -1,12 +1,28 @@
+import base64
 import json
 import os
 import requests
 from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError
 
+from contextlib import ExitStack
 import subprocess
+import threading
 import time
-from urllib.parse import parse_qs
+from urllib.parse import parse_qs, urlparse
+
+from exceptions import SearchResultMissingFile
+from utils.metrics import METRICS
+
+search_seconds = METRICS.histogram(
+    "jackett_search_seconds", "Jackett search requests, including the wait "
+    "for an indexer slot")
+searches = METRICS.counter("jackett_searches_total",
+                           "Jackett searches, by status")
+torrent_download_seconds = METRICS.histogram(
+    "jackett_torrent_download_seconds", ".torrent file downloads")
+cli_seconds = METRICS.histogram("bittorrent_cli_seconds",
+                                "torrent_cli.py subprocesses, by command")
 
 
 class Jackett:
@@ -19,6 +35,9 @@ class Jackett:
     }
 
     def check_server_is_running(self):
+        # A throwaway session with a single retry, rather than the shared
+        # one with its [http] retries and backoff, so a run fails fast
+        # when Jackett is down.
         s = requests.Session()
         s.mount(self.host, HTTPAdapter(max_retries=1))
 
@@ -48,9 +67,19 @@ class Jackett:
         # Set self.trackers as a list.
         self.trackers = self.config["trackers"].split(",")
 
-
-    def __init__(self, config_section):
+        # Concurrent searches: size of the fetcher's search pool and the
+        # maximum number of in-flight searches against any one indexer.
+        self.search_workers = self.config.getint("search_workers", fallback=8)
+        self.indexer_concurrency = self.config.getint("indexer_concurrency",
+                                                      fallback=4)
+        self.indexer_slots = {
+            tracker: threading.BoundedSemaphore(self.indexer_concurrency)
+            for tracker in self.trackers
+        }
+
+    def __init__(self, config_section, http):
         self.config = config_section
+        self.http = http
         self.set_config_values()
         self.check_server_is_running()
 
@@ -58,14 +87,20 @@ class Jackett:
         """Search Jackett server (running locally) """
         trackers = ",".join(self.trackers)
 
-        response = requests.get(
-            self.search_url,
-            params={
-                "Query": search_str,
-                "Tracker[]": trackers,
-                "apikey": self.apikey,
-            }
-        )
+        # Hold a slot on every queried indexer. Acquire in sorted order so
+        # concurrent searches can never deadlock on each other.
+        with search_seconds.time(), ExitStack() as stack:
+            for tracker in sorted(self.indexer_slots):
+                stack.enter_context(self.indexer_slots[tracker])
+            response = self.http.get(
+                self.search_url,
+                params={
+                    "Query": search_str,
+                    "Tracker[]": trackers,
+                    "apikey": self.apikey,
+                }
+            )
+        searches.inc(status=response.status_code)
         if response.status_code != 200:
             raise Exception(response.reason)
         return json.loads(response.content)["Results"]
@@ -78,8 +113,8 @@ class Jackett:
 
     def output_torrent_file(self, series_name, filename):
         series_folder = self._series_folder(series_name)
-        if not os.path.exists(series_folder):
-            os.mkdir(series_folder)
+        # Concurrent fetches may create the same series folder.
+        os.makedirs(series_folder, exist_ok=True)
 
         filename = "_".join(filename.split())
         return os.path.join(
@@ -88,14 +123,24 @@ class Jackett:
         )
 
     def download_torrent_file(self, series_name, search_result):
-        torrent_filename = self.get_torrent_file_from_search(
-            search_result
+        return self.download_torrent(series_name, search_result)[0]
+
+    def download_torrent(self, series_name, search_result):
+        """
+        Save the result's .torrent; returns (path, contents) so callers
+        can parse it without reading it back from disk.
+        """
+        torrent_filename = (
+            search_result.get("filename")
+            or self.get_torrent_file_from_search(search_result)
         )
         out_torrent_file = self.output_torrent_file(series_name, torrent_filename)
+        with torrent_download_seconds.time():
+            response = self.http.get(search_result["Link"],
+                                     headers=self.headers)
         with open(out_torrent_file,  "wb") as outf:
-            response = requests.get(search_result["Link"], headers=self.headers)
             outf.write(response.content)
-        return out_torrent_file
+        return out_torrent_file, response.content
 
     def get_torrent_file_from_search(self, search_result):
         try:
@@ -106,9 +151,33 @@ class Jackett:
             raise SearchResultMissingFile
         return filename[0]
 
+    def get_info_hash_from_search(self, search_result):
+        """
+        Lowercase hex info hash of a search result, from its InfoHash or
+        MagnetUri; None when it has neither, or a malformed base32 one.
+        """
+        info_hash = search_result.get("InfoHash")
+        if not info_hash:
+            magnet = search_result.get("MagnetUri") or ""
+            params = parse_qs(urlparse(magnet).query)
+            for xt in params.get("xt", []):
+                if xt.lower().startswith("urn:btih:"):
+                    info_hash = xt[len("urn:btih:"):]
+                    break
+        if not info_hash:
+            return None
+        if len(info_hash) == 32:
+            # Base32 encoded, as some magnet links carry it.
+            try:
+                info_hash = base64.b32decode(info_hash.upper()).hex()
+            except ValueError:
+                # binascii.Error; skip the hash, not the whole search.
+                return None
+        return info_hash.lower()
+
     @property
     def python3path(self):
-        return os.path.join(
+        return self.config.get("bittorrent_python") or os.path.join(
             os.path.abspath(__file__ + "/../../"),
             "venv",
             "bin",
@@ -117,7 +186,7 @@ class Jackett:
 
     @property
     def bittorrent_cli(self):
-        return os.path.join(
+        return self.config.get("bittorrent_cli") or os.path.join(
             os.path.abspath(__file__ + "/../../"),
             "vendor",
             "bit-torrent",
@@ -125,16 +194,27 @@ class Jackett:
         )
 
     def bittorrent_cli_status(self):
+        """
+        (stdout, stderr) of `torrent_cli.py status -v`; stdout is None
+        when the command fails.
+        """
         Popen_args = [
             self.python3path,
             self.bittorrent_cli,
             "status",
             "-v",
         ]
-        status_process = subprocess.Popen(Popen_args,
-                                          stdout=subprocess.PIPE,
-                                          stderr=subprocess.PIPE)
-        stdout, stderr = status_process.communicate()
+        with cli_seconds.time(command="status"):
+            try:
+                status_process = subprocess.Popen(Popen_args,
+                                                  stdout=subprocess.PIPE,
+                                                  stderr=subprocess.PIPE)
+            except OSError as e:
+                return (None, str(e).encode())
+            stdout, stderr = status_process.communicate()
+        if status_process.returncode:
+            # torrent_cli.py couldn't reach the bit-torrent daemon.
+            return (None, stderr)
         return (stdout, stderr)
 
     def start_torrent_transfer(self, torrent_file, download_directory):
@@ -146,10 +226,11 @@ class Jackett:
             "-d",
             download_directory,
         ]
-        start_torrent_process = subprocess.Popen(Popen_args,
-                                                 stdout=subprocess.PIPE,
-                                                 stderr=subprocess.PIPE)
-        stdout, stderr = start_torrent_process.communicate()
+        with cli_seconds.time(command="add"):
+            start_torrent_process = subprocess.Popen(Popen_args,
+                                                     stdout=subprocess.PIPE,
+                                                     stderr=subprocess.PIPE)
+            stdout, stderr = start_torrent_process.communicate()
         if bool(stderr.decode()):
             raise Exception("Error initiating torrent transfer: "
                             "{}".format(stderr.decode()))
@@ -161,9 +242,10 @@ class Jackett:
             "pause",
             torrent_file,
         ]
-        pause_torrent_process = subprocess.Popen(Popen_args,
-                                                 stdout=subprocess.PIPE,
-                                                 stderr=subprocess.PIPE)
-        stdout, stderr = pause_torrent_transfer.communicate()
+        with cli_seconds.time(command="pause"):
+            pause_torrent_process = subprocess.Popen(Popen_args,
+                                                     stdout=subprocess.PIPE,
+                                                     stderr=subprocess.PIPE)
+            stdout, stderr = pause_torrent_process.communicate()
         if bool(stderr.decode()):
             raise Exception("Error pausing torrent {}".format(stderr.decode()))
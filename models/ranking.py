@@ -0,0 +1,152 @@
+import math
+import re
+
+from utils.config_parser import get_optional_config_values
+
+MB = 1024 * 1024
+
+_token = re.compile(r"[a-z0-9]+")
+
+
+def _tokens(text):
+    return _token.findall((text or "").lower())
+
+
+def _list(value):
+    return tuple(v.strip().lower() for v in value.split(",") if v.strip())
+
+
+class ResultRanker:
+    """
+    Scores Jackett search results by how soon they are likely to finish
+    downloading and how well they match the episode, instead of by
+    seeders alone.
+
+    - Download speed is estimated from the swarm: seeders, discounted by
+      the leechers competing for them. Larger torrents are penalised by
+      `size_weight`, so a small well-seeded release beats a huge one.
+    - Results outside `min_size_mb`/`max_size_mb` (when set) are dropped.
+    - Titles containing every token of the episode's indexed name score
+      `match_weight`, or half that for the shortened name. With
+      `require_match`, results matching neither are dropped.
+    - `resolutions` and `codecs` list preferred release tags, most
+      preferred first; earlier tags score higher.
+    """
+
+    options = {
+        "min_size_mb": float,
+        "max_size_mb": float,
+        "require_match": bool,
+        "resolutions": _list,
+        "codecs": _list,
+        "size_weight": float,
+        "match_weight": float,
+        "preference_weight": float,
+    }
+
+    def __init__(self, min_size_mb=0, max_size_mb=0, require_match=False,
+                 resolutions=(), codecs=(), size_weight=0.5, match_weight=2.0,
+                 preference_weight=1.0):
+        self.min_size_mb = min_size_mb
+        self.max_size_mb = max_size_mb
+        self.require_match = require_match
+        self.resolutions = resolutions
+        self.codecs = codecs
+        self.size_weight = size_weight
+        self.match_weight = match_weight
+        self.preference_weight = preference_weight
+
+    @classmethod
+    def from_config(cls, config, series_id=None):
+        """
+        Ranker for `series_id`: [ranking] options, overridden by those in
+        [ranking.<series_id>].
+        """
+        sections = ["ranking"]
+        if series_id is not None:
+            sections.append(f"ranking.{series_id}")
+
+        kwargs = {}
+        for section in sections:
+            values = get_optional_config_values(config, section)
+            for option, parse in cls.options.items():
+                if option not in values:
+                    continue
+                if parse is bool:
+                    kwargs[option] = values.getboolean(option)
+                else:
+                    kwargs[option] = parse(values[option])
+        return cls(**kwargs)
+
+    def _within_size(self, size_mb):
+        if not size_mb:
+            return True
+        if self.min_size_mb and size_mb < self.min_size_mb:
+            return False
+        if self.max_size_mb and size_mb > self.max_size_mb:
+            return False
+        return True
+
+    @staticmethod
+    def _matches(title, name):
+        # "e01" in a shortened name matches the "s01e01" title token.
+        return all(
+            token in title or any(t.endswith(token) for t in title)
+            for token in name
+        )
+
+    def _match(self, title, names):
+        for weight, name in zip((1.0, 0.5), names):
+            if name and self._matches(title, name):
+                return weight
+        return 0.0
+
+    @staticmethod
+    def _preference(title, preferred):
+        for i, tag in enumerate(preferred):
+            if tag in title:
+                return (len(preferred) - i) / len(preferred)
+        return 0.0
+
+    def score(self, search_results, names=()):
+        """
+        Scores for `search_results`, in order; None for dropped results.
+        `names` are the indexed name and, optionally, the shortened name.
+        """
+        names = [_tokens(name) for name in names]
+        titles = [set(_tokens(r.get("Title"))) for r in search_results]
+        seeders = [r.get("Seeders") or 0 for r in search_results]
+        peers = [r.get("Peers") or 0 for r in search_results]
+        sizes = [(r.get("Size") or 0) / MB for r in search_results]
+
+        scores = []
+        for title, s, p, size_mb in zip(titles, seeders, peers, sizes):
+            match = self._match(title, names)
+            if not self._within_size(size_mb) or (
+                    self.require_match and not match):
+                scores.append(None)
+                continue
+
+            # Jackett's Peers count includes the seeders.
+            leechers = max(p - s, 0)
+            rate = s / (1 + leechers / (s + 1))
+            scores.append(
+                math.log1p(rate)
+                - self.size_weight * math.log1p(size_mb / 1024)
+                + self.match_weight * match
+                + self.preference_weight * (
+                    self._preference(title, self.resolutions)
+                    + self._preference(title, self.codecs)
+                )
+            )
+        return scores
+
+    def rank(self, search_results, names=()):
+        """Search results sorted best first, without dropped results."""
+        scored = zip(self.score(search_results, names), search_results)
+        ranked = sorted(
+            (pair for pair in scored if pair[0] is not None),
+            key=lambda pair: pair[0],
+            reverse=True,
+        )
+        return [result for _, result in ranked]
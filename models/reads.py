@@ -0,0 +1,82 @@
+"""
+Column-projected reads for listing and queue building. Rows are fetched
+through Core and kept as plain rows or slotted records, skipping ORM
+object construction, the identity map and unused columns such as
+Episode.overview.
+"""
+from sqlalchemy import and_, func, select
+
+from .db import Episode, EpisodeNames, Series
+
+
+class EpisodeRecord(EpisodeNames):
+    """
+    The columns of an Episode needed to search for it and schedule its
+    next search, plus its series' name.
+    """
+    __slots__ = (
+        "series_id",
+        "id",
+        "season_number",
+        "episode_number",
+        "search_attempts",
+        "last_searched_at",
+        "next_search_at",
+        "series_name",
+    )
+
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    @classmethod
+    def project(cls, query):
+        """Narrow an Episode query to the record's columns."""
+        return (
+            query
+            .join(Series, Series.id == Episode.series_id)
+            .with_entities(
+                Episode.series_id,
+                Episode.id,
+                Episode.season_number,
+                Episode.episode_number,
+                Episode.search_attempts,
+                Episode.last_searched_at,
+                Episode.next_search_at,
+                Series.name,
+            )
+        )
+
+    @classmethod
+    def fetch(cls, session, query):
+        """Run a projected query's statement and build records."""
+        return [cls(*row) for row in session.execute(query.statement)]
+
+
+def latest_episodes(session, per_series=3):
+    """
+    (series_id, series_name, rank, episode_number, air_date) rows of
+    each series' `per_series` latest episodes, newest (rank 1) first, in
+    one query ranking episodes with ROW_NUMBER() over each series. Series
+    without episodes get a single row with a rank of None.
+    """
+    rank = func.row_number().over(
+        partition_by=Episode.series_id,
+        order_by=Episode.air_date.desc(),
+    ).label("rank")
+    latest = select([
+        Episode.series_id,
+        Episode.episode_number,
+        Episode.air_date,
+        rank,
+    ]).alias("latest")
+    query = (
+        select([Series.id, Series.name, latest.c.rank,
+                latest.c.episode_number, latest.c.air_date])
+        .select_from(Series.__table__.outerjoin(latest, and_(
+            latest.c.series_id == Series.id,
+            latest.c.rank <= per_series,
+        )))
+        .order_by(Series.id, latest.c.rank)
+    )
+    return session.execute(query).fetchall()
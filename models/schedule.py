@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_
+
+from .db import Episode
+
+
+class SearchSchedule:
+    """
+    Decides which candidate episodes are worth a Jackett search this run,
+    and in what order.
+
+    - Episodes without an air date, or airing within the last
+      `grace_hours`, are skipped until they can plausibly be found.
+    - With `max_age_days`, episodes that aired longer ago are skipped.
+    - Episodes without a season or episode number are skipped: they
+      have no sNNeNN name to search for.
+    - Season 0 specials are skipped unless `include_specials`.
+    - Every failed search pushes an episode's next search back
+      exponentially, from `backoff_hours` up to `max_backoff_hours`.
+
+    The queue is ordered by fewest failed attempts, then newest air date,
+    and capped at `max_episodes` (0 for no cap).
+    """
+
+    def __init__(self, grace_hours=6, max_age_days=0, include_specials=False,
+                 backoff_hours=1, max_backoff_hours=168, max_episodes=0):
+        self.grace = timedelta(hours=grace_hours)
+        self.max_age = timedelta(days=max_age_days) if max_age_days else None
+        self.include_specials = include_specials
+        self.backoff = timedelta(hours=backoff_hours)
+        self.max_backoff = timedelta(hours=max_backoff_hours)
+        self.max_episodes = max_episodes
+
+    @classmethod
+    def from_config(cls, config_section):
+        return cls(
+            grace_hours=config_section.getfloat("grace_hours", fallback=6),
+            max_age_days=config_section.getint("max_age_days", fallback=0),
+            include_specials=config_section.getboolean("include_specials",
+                                                       fallback=False),
+            backoff_hours=config_section.getfloat("backoff_hours", fallback=1),
+            max_backoff_hours=config_section.getfloat("max_backoff_hours",
+                                                      fallback=168),
+            max_episodes=config_section.getint("max_episodes", fallback=0),
+        )
+
+    def apply(self, query, now=None):
+        now = now or datetime.utcnow()
+        query = (
+            query
+            .filter(Episode.air_date.isnot(None))
+            .filter(Episode.air_date <= now - self.grace)
+            .filter(Episode.season_number.isnot(None))
+            .filter(Episode.episode_number.isnot(None))
+            .filter(or_(
+                Episode.next_search_at.is_(None),
+                Episode.next_search_at <= now,
+            ))
+        )
+        if self.max_age:
+            query = query.filter(Episode.air_date >= now - self.max_age)
+        if not self.include_specials:
+            query = query.filter(Episode.season_number != 0)
+
+        query = query.order_by(
+            func.coalesce(Episode.search_attempts, 0),
+            Episode.air_date.desc(),
+        )
+        if self.max_episodes:
+            query = query.limit(self.max_episodes)
+        return query
+
+    def record_failure(self, episode, now=None):
+        now = now or datetime.utcnow()
+        episode.search_attempts = (episode.search_attempts or 0) + 1
+        episode.last_searched_at = now
+        delay = self.backoff * 2 ** (episode.search_attempts - 1)
+        episode.next_search_at = now + min(delay, self.max_backoff)
+
+    def record_success(self, episode, now=None):
+        episode.search_attempts = 0
+        episode.last_searched_at = now or datetime.utcnow()
+        episode.next_search_at = None
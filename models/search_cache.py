@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+import json
+
+from sqlalchemy import and_, bindparam
+
+from .db import SearchResultCache
+
+
+class SearchCache:
+    """
+    Jackett search results cached in the db, keyed on
+    (query string, tracker set).
+
+    Empty results are kept for `negative_ttl` minutes, everything else for
+    `ttl` minutes. Once more than `max_entries` rows are stored the least
+    recently used ones are evicted. A `ttl` of 0 disables the cache.
+
+    Entries are kept by key once looked up, or preload()ed for a whole
+    queue at once, until the next evict().
+    """
+
+    def __init__(self, session, ttl=60, negative_ttl=720, max_entries=10000):
+        self.session = session
+        self.ttl = timedelta(minutes=ttl)
+        self.negative_ttl = timedelta(minutes=negative_ttl)
+        self.max_entries = max_entries
+        self._entries = {}
+
+    @classmethod
+    def from_config(cls, session, config_section):
+        return cls(
+            session,
+            ttl=config_section.getint("cache_ttl", fallback=60),
+            negative_ttl=config_section.getint("cache_negative_ttl",
+                                               fallback=720),
+            max_entries=config_section.getint("cache_max_entries",
+                                              fallback=10000),
+        )
+
+    @property
+    def enabled(self):
+        return bool(self.ttl)
+
+    @staticmethod
+    def _trackers_key(trackers):
+        return ",".join(sorted(trackers))
+
+    def _entry(self, query, trackers):
+        key = (query, self._trackers_key(trackers))
+        if key not in self._entries:
+            self._entries[key] = self.session.query(SearchResultCache).get(key)
+        return self._entries[key]
+
+    def preload(self, queries, trackers):
+        """Look up the entries for `queries` with one IN query per 500."""
+        if not self.enabled:
+            return
+        trackers = self._trackers_key(trackers)
+        queries = sorted({
+            query for query in queries
+            if (query, trackers) not in self._entries
+        })
+        for i in range(0, len(queries), 500):
+            chunk = queries[i:i + 500]
+            for query in chunk:
+                self._entries[(query, trackers)] = None
+            entries = (
+                self.session.query(SearchResultCache)
+                .filter(SearchResultCache.trackers == trackers)
+                .filter(SearchResultCache.query.in_(chunk))
+            )
+            for entry in entries:
+                self._entries[(entry.query, trackers)] = entry
+
+    def get(self, query, trackers):
+        """
+        Returns the cached results (possibly an empty list), or None
+        when the query has to be searched.
+        """
+        if not self.enabled:
+            return None
+        entry = self._entry(query, trackers)
+        if entry is None:
+            return None
+
+        now = datetime.utcnow()
+        ttl = self.ttl if entry.result_count else self.negative_ttl
+        if entry.created_at + ttl < now:
+            return None
+        entry.accessed_at = now
+        return json.loads(entry.results)
+
+    def set(self, query, trackers, results):
+        if not self.enabled:
+            return
+        now = datetime.utcnow()
+        entry = self._entry(query, trackers)
+        if entry is None:
+            entry = SearchResultCache(
+                query=query,
+                trackers=self._trackers_key(trackers),
+            )
+            self.session.add(entry)
+            self._entries[(query, entry.trackers)] = entry
+        entry.results = json.dumps(results)
+        entry.result_count = len(results)
+        entry.created_at = now
+        entry.accessed_at = now
+
+    def evict(self):
+        """
+        Drop the least recently used entries beyond `max_entries`, by
+        primary key so entries tied on accessed_at with the last one
+        kept survive.
+        """
+        self._entries = {}
+        stale = (
+            self.session.query(SearchResultCache.query,
+                               SearchResultCache.trackers)
+            .order_by(SearchResultCache.accessed_at.desc(),
+                      SearchResultCache.query)
+            .offset(self.max_entries)
+        ).all()
+        if not stale:
+            return
+        table = SearchResultCache.__table__
+        self.session.execute(
+            table.delete().where(and_(
+                table.c.query == bindparam("stale_query"),
+                table.c.trackers == bindparam("stale_trackers"),
+            )),
+            [
+                {"stale_query": query, "stale_trackers": trackers}
+                for query, trackers in stale
+            ],
+        )
@@ -0,0 +1,122 @@
+import re
+
+UNITS = {
+    "": 1,
+    "B": 1,
+    "KiB": 1024,
+    "MiB": 1024 ** 2,
+    "GiB": 1024 ** 3,
+    "TiB": 1024 ** 4,
+}
+
+_number = re.compile(r"[\d.]+")
+_size = re.compile(r"([\d.]+)\s*([KMGT]iB|B)?")
+_fields = re.compile(r"\s{2,}")
+
+
+class TorrentStatus:
+    """
+    One torrent's status. Speeds are bytes/s and sizes bytes; fields the
+    client didn't report are None.
+    """
+    __slots__ = (
+        "name",
+        "info_hash",
+        "state",
+        "download_speed",
+        "upload_speed",
+        "size_completed",
+        "size_total",
+        "ratio",
+        "progress",
+    )
+
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            setattr(self, field, fields.get(field))
+
+    def __repr__(self):
+        return "TorrentStatus({})".format(", ".join(
+            f"{field}={getattr(self, field)!r}" for field in self.__slots__
+        ))
+
+    @property
+    def complete(self):
+        return self.progress is not None and self.progress >= 100
+
+
+def _to_size(value):
+    match = _size.search(value)
+    if not match:
+        return None
+    number, unit = match.groups()
+    return float(number) * UNITS[unit or ""]
+
+
+def _to_float(value):
+    match = _number.search(value)
+    return float(match.group()) if match else None
+
+
+def _set_size(status, value):
+    completed, _, total = value.partition("/")
+    status.size_completed = _to_size(completed)
+    status.size_total = _to_size(total)
+
+
+# "<Key>: <value>" as printed by `torrent_cli.py status -v`.
+_setters = {
+    "ID": lambda status, value: setattr(status, "info_hash", value),
+    "State": lambda status, value: setattr(status, "state", value),
+    "Download speed": lambda status, value: setattr(
+        status, "download_speed", _to_size(value)),
+    "Upload speed": lambda status, value: setattr(
+        status, "upload_speed", _to_size(value)),
+    "Size": _set_size,
+    "Ratio": lambda status, value: setattr(status, "ratio", _to_float(value)),
+    "Progress": lambda status, value: setattr(
+        status, "progress", _to_float(value)),
+}
+
+
+def _lines(output):
+    if isinstance(output, bytes):
+        output = output.decode()
+    if isinstance(output, str):
+        return iter(output.splitlines())
+    return (
+        line.decode() if isinstance(line, bytes) else line for line in output
+    )
+
+
+def parse_statuses(output):
+    """
+    Yield a TorrentStatus per torrent in the bit-torrent client's status
+    output, in a single pass. `output` may be str, bytes or any iterable
+    of lines (e.g. a subprocess's stdout), so it can be streamed.
+
+    Each "Name:" line starts a new record; fields may come in any order
+    and several may share a line, separated by two or more spaces.
+    """
+    lines = _lines(output)
+    status = None
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.startswith("Name:"):
+            if status is not None:
+                yield status
+            status = TorrentStatus(name=stripped[5:].strip())
+            continue
+        if status is None:
+            continue
+
+        for field in _fields.split(stripped):
+            key, _, value = field.partition(":")
+            setter = _setters.get(key)
+            if setter:
+                setter(status, value.strip())
+
+    if status is not None:
+        yield status
@@ -1,17 +1,35 @@
+import calendar
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import json
-import requests
 
 from .db import (
+    engine_options,
     get_session,
     Episode,
     Series,
 )
+from .reads import latest_episodes
 from exceptions import MissingSeries
 from utils.config_parser import get_config_values
 from utils.decorators import must_be_set
+from utils.http import get_http_session
+from utils.metrics import METRICS
+from utils.rate_limit import RateLimiter
 
 TOKEN = "jwt_token"
+WEEK = 7 * 24 * 60 * 60
+
+request_seconds = METRICS.histogram(
+    "tvdb_request_seconds", "TVDB GET requests, including the rate limit wait")
+requests_total = METRICS.counter("tvdb_requests_total",
+                                 "TVDB GET requests, by status")
+episodes_synced = METRICS.counter("tvdb_episodes_synced_total",
+                                  "Episodes inserted or updated, by action")
+
+
+def _epoch(utc_datetime):
+    return calendar.timegm(utc_datetime.utctimetuple())
 
 
 class TVDBAPI:
@@ -29,6 +47,7 @@ class TVDBAPI:
         "episodes": "/series/{}/episodes",
         "search": "/search/series",
         "series": "/series/{}",
+        "updated": "/updated/query",
     }
 
     def update_headers(self):
@@ -41,17 +60,32 @@ class TVDBAPI:
         db_values = get_config_values(self.config, "db")
         self.base_endpoint = config_values.get("endpoint")
         self.apikey = config_values.get("apikey")
-        self.session = get_session(db_values.get("uri"))
+        if self.session is None:
+            self.session = get_session(db_values.get("uri"),
+                                       **engine_options(db_values))
+        self.http = get_http_session(self.config)
+        # Episode pages for many series are fetched concurrently, but
+        # every request to TVDB shares a single rate limit.
+        self.sync_workers = config_values.getint("sync_workers", fallback=8)
+        self.rate_limiter = RateLimiter(
+            config_values.getfloat("requests_per_second", fallback=5),
+            burst=config_values.getint("request_burst", fallback=5),
+        )
+        # /updated/query is limited to one week per request; series last
+        # synced longer ago than this are synced in full instead.
+        self.max_update_weeks = config_values.getint("max_update_weeks",
+                                                     fallback=12)
 
-    def __init__(self, config_fp):
+    def __init__(self, config_fp, session=None):
         self.config = config_fp
+        self.session = session
         self._set_config_values()
         self.series_map = dict()
 
     def login(self):
         login_endpoint = self.base_endpoint + "/login"
         data = {"apikey": self.apikey}
-        response = requests.post(
+        response = self.http.post(
             login_endpoint,
             headers=self.headers,
             json=data
@@ -67,57 +101,56 @@ class TVDBAPI:
     def search_for_series(self, series_name):
         search_endpoint = self.base_endpoint + self.routes["search"]
         payload = {"name": series_name}
-        response = requests.get(
-            search_endpoint,
-            headers=self.headers,
-            params=payload,
-        )
+        response = self._get(search_endpoint, payload)
         if response.status_code != 200:
             raise Exception("Invalid Request")
 
         content = json.loads(response.content)
         return content["data"]
 
+    def _get(self, endpoint, params):
+        with request_seconds.time():
+            self.rate_limiter.wait()
+            response = self.http.get(endpoint, headers=self.headers,
+                                     params=params)
+        requests_total.inc(status=response.status_code)
+        return response
+
     def _page_through_response(self, series_id, endpoint, response):
-        content = json.loads(response.content)
-        yield content.get("data")
+        while True:
+            if response.status_code != 200:
+                raise Exception("Invalid Request")
+            content = json.loads(response.content)
+            yield content.get("data") or []
 
-        links = content.get("links")
-        if not links or not links.get("next"):
-            return
-        link_next = links.get("next")
-        self.series_map[series_id] = link_next
+            links = content.get("links")
+            if not links or not links.get("next"):
+                return
+            link_next = links.get("next")
+            self.series_map[series_id] = link_next
 
-        payload = {"page": link_next}
-        res = requests.get(
-            endpoint,
-            headers=self.headers,
-            params=payload,
-        )
-        return self._page_through_response(series_id, endpoint, res)
+            response = self._get(endpoint, {"page": link_next})
 
     @must_be_set(TOKEN)
     def get_series_episodes(self, series):
-        series_id = series.id
+        return self._series_episode_pages(series.id, series.pages)
+
+    def _series_episode_pages(self, series_id, start_page=0):
+        """
+        Yields each page of episodes for `series_id`.
+        Takes plain values so it is safe to run off the session's thread.
+        """
         series_endpoint = (
             self.base_endpoint + self.routes["episodes"].format(series_id)
         )
         payload = {}
 
         # If we have seen this series before and it requires paging:
-        if series.pages > 0:
-            payload["page"] = series.pages
-
-        #TODO
-        response = requests.get(
-            series_endpoint,
-            headers=self.headers,
-            params=payload,
-        )
-        if response.status_code != 200:
-            raise Exception("Invalid Request")
+        if start_page and start_page > 0:
+            payload["page"] = start_page
 
-        return self._page_through_response(
+        response = self._get(series_endpoint, payload)
+        yield from self._page_through_response(
             series_id,
             series_endpoint,
             response,
@@ -185,18 +218,98 @@ class TVDBAPI:
         if series:
             self.add_series(series)
 
-    def add_series_episodes(self, series_ids=None):
+    @must_be_set(TOKEN)
+    def updated_series(self, since):
+        """
+        Map of series id -> lastUpdated (epoch) for every series changed
+        on TVDB since `since`. Returns None if `since` is too far back.
+        """
+        now = _epoch(datetime.utcnow())
+        if now - since > self.max_update_weeks * WEEK:
+            return None
+
+        updated_endpoint = self.base_endpoint + self.routes["updated"]
+        updated = {}
+        from_time = since
+        while from_time < now:
+            to_time = min(from_time + WEEK, now)
+            payload = {"fromTime": from_time, "toTime": to_time}
+            response = self._get(updated_endpoint, payload)
+            if response.status_code != 200:
+                raise Exception("Invalid Request")
+            content = json.loads(response.content)
+            for series in content.get("data") or []:
+                updated[series["id"]] = series["lastUpdated"]
+            from_time = to_time
+        return updated
+
+    def add_series_episodes(self, series_ids=None, full=False):
+        """
+        Sync episodes for series that changed on TVDB since they were
+        last synced. Changed series are re-read from their first page so
+        edits to existing episodes are picked up; series never synced
+        before resume from their stored page. `full` syncs every series.
+        """
         query = self.session.query(Series)
         if series_ids:
             query = query.filter(Series.id.in_(series_ids))
 
-        for series in query:
-            # yielded lists
-            for episodes in self.get_series_episodes(series):
-                self._insert_episodes(series, episodes)
+        sync_started = datetime.utcnow()
+        series_list = query.all()
+        synced = [s for s in series_list if s.last_synced_at is not None]
+
+        updated = {}
+        if synced and not full:
+            since = min(_epoch(s.last_synced_at) for s in synced)
+            updated = self.updated_series(since)
+            full = updated is None
+
+        to_sync = []
+        for series in series_list:
+            if series.last_synced_at is None:
+                to_sync.append((series, series.pages))
+            elif full or updated.get(series.id, 0) >= _epoch(series.last_synced_at):
+                to_sync.append((series, 0))
+
+        skipped = len(series_list) - len(to_sync)
+        if skipped:
+            print(f"Skipping {skipped} series unchanged since last sync")
+
+        self.sync_series_episodes(to_sync)
         self._update_series_max_page()
+        for series in series_list:
+            series.last_synced_at = sync_started
+        self.session.commit()
+
+    @must_be_set(TOKEN)
+    def sync_series_episodes(self, series_pages):
+        """
+        Fetch episode pages for every (series, start_page) in
+        `series_pages` concurrently.
+        Pages are written as each series finishes, from this thread only,
+        so the db session has a single writer.
+        """
+        fetch_pages = lambda series_id, pages: list(
+            self._series_episode_pages(series_id, pages)
+        )
+        with ThreadPoolExecutor(max_workers=self.sync_workers) as pool:
+            futures = {
+                pool.submit(fetch_pages, series.id, start_page): series
+                for series, start_page in series_pages
+            }
+            for future in as_completed(futures):
+                series = futures[future]
+                # yielded lists
+                for episodes in future.result():
+                    self._insert_episodes(series, episodes)
 
     def _insert_episodes(self, series, episodes):
+        """
+        Upsert one page of TVDB episodes.
+        Existing rows for the page are fetched in a single query; new
+        episodes are bulk inserted and changed ones bulk updated.
+        Returns (inserted, updated) counts.
+        """
         def get_fields(ep):
 
             air_date = ep.get("firstAired")
@@ -215,20 +328,43 @@ class TVDBAPI:
                 "air_date": air_date,
                 "overview": ep.get("overview"),
             }
-        added = 0
+        rows = {}
         for ep in episodes:
-            query = (
-                self.session.query(Episode)
-                .filter(Episode.id == ep.get("id"))
-                .filter(Episode.series_id == ep.get("seriesId"))
-            )
-            if query.first() is None:
-                new_ep = Episode(**get_fields(ep))
-                self.session.add(new_ep)
-                added += 1
-
-        print('Added {} episodes for "{}"'.format(added, series.name))
+            fields = get_fields(ep)
+            rows[(fields["series_id"], fields["id"])] = fields
+        if not rows:
+            return (0, 0)
+
+        columns = [
+            Episode.series_id,
+            Episode.id,
+            Episode.season_number,
+            Episode.episode_number,
+            Episode.name,
+            Episode.air_date,
+            Episode.overview,
+        ]
+        query = (
+            self.session.query(*columns)
+            .filter(Episode.series_id.in_({k[0] for k in rows}))
+            .filter(Episode.id.in_({k[1] for k in rows}))
+        )
+        existing = {(row.series_id, row.id): row._asdict() for row in query}
+
+        inserts = [r for key, r in rows.items() if key not in existing]
+        updates = [
+            r for key, r in rows.items()
+            if key in existing and existing[key] != r
+        ]
+        self.session.bulk_insert_mappings(Episode, inserts)
+        self.session.bulk_update_mappings(Episode, updates)
         self.session.commit()
+        episodes_synced.inc(len(inserts), action="inserted")
+        episodes_synced.inc(len(updates), action="updated")
+
+        print('Added {} and updated {} episodes for "{}"'
+              .format(len(inserts), len(updates), series.name))
+        return (len(inserts), len(updates))
 
     def _update_series_max_page(self):
         """
@@ -241,14 +377,17 @@ class TVDBAPI:
         self.session.commit()
 
     def view_all_series(self):
-        for series in self.session.query(Series):
-            print(f"{series.id}: {series.name}: Latest Episode(s)")
-            query = (
-                self.session.query(Episode)
-                .filter(Episode.series_id == series.id)
-            ).order_by(Episode.air_date.desc()).limit(3)
-            for ep in query:
-                print(f"{ep.episode_number} - {ep.air_date}")
+        current = None
+        rows = latest_episodes(self.session, per_series=3)
+        for series_id, name, rank, episode_number, air_date in rows:
+            if series_id != current:
+                if current is not None:
+                    print("-" * 10)
+                current = series_id
+                print(f"{series_id}: {name}: Latest Episode(s)")
+            if rank is not None:
+                print(f"{episode_number} - {air_date}")
+        if current is not None:
             print("-" * 10)
 
 
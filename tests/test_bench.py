@@ -0,0 +1,35 @@
+import contextlib
+import io
+import unittest
+
+from bench import run
+from utils.config_parser import config_parser
+
+
+class BenchSmokeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # The benchmark configs would otherwise leak into other tests
+        # through the shared parser.
+        saved = {name: dict(config_parser[name])
+                 for name in config_parser.sections()}
+
+        def restore():
+            config_parser.clear()
+            config_parser.read_dict(saved)
+        self.addCleanup(restore)
+
+    def test_all_benchmarks_run(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = run.main([
+                "--episodes", "40", "--searches", "4", "--latency", "0",
+                "--workers", "2", "--sync-series", "2", "--pages", "2",
+                "--torrents", "20", "--archives", "1", "--archive-mb", "1",
+            ])
+
+        self.assertEqual(set(results), set(run.BENCHMARKS))
+        self.assertEqual(results["search"]["searched"], 4)
+        self.assertEqual(results["search"]["search_latency"]["calls"], 4)
+        self.assertEqual(results["sync"]["episodes"], 400)
+        self.assertEqual(results["status"]["torrents"], 20)
+        self.assertEqual(results["extraction"]["zip"]["archives"], 1)
@@ -0,0 +1,79 @@
+import hashlib
+import unittest
+
+from utils.bencode import BencodeError, _Reader, decode, torrent_metadata
+
+
+def encode(value):
+    if isinstance(value, int):
+        return b"i%de" % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b"%d:%s" % (len(value), value)
+    if isinstance(value, list):
+        return b"l" + b"".join(encode(v) for v in value) + b"e"
+    return b"d" + b"".join(
+        encode(k) + encode(v) for k, v in sorted(value.items())
+    ) + b"e"
+
+
+class BencodeTestCase(unittest.TestCase):
+
+    def test_decode(self):
+        data = encode({"a": [1, -2, "three"], "b": {"c": b"\x00\xff"}})
+        self.assertEqual(
+            decode(data),
+            {b"a": [1, -2, b"three"], b"b": {b"c": b"\x00\xff"}},
+        )
+
+    def test_decode_rejects_truncated_data(self):
+        for data in (b"d1:ai1e", b"5:abc", b"x", encode([1]) + b"e"):
+            with self.assertRaises(BencodeError):
+                decode(data)
+
+    def test_multi_file_torrent(self):
+        info = {
+            "name": "Show.S01E01.720p",
+            "piece length": 262144,
+            "pieces": b"\x01" * 20 * 100,
+            "files": [
+                {"length": 100, "path": ["show.s01e01.rar"]},
+                {"length": 100, "path": ["show.s01e01.r00"]},
+                {"length": 5, "path": ["Subs", "english.srt"]},
+            ],
+        }
+        data = encode({"announce": "http://tracker/", "info": info})
+        metadata = torrent_metadata(memoryview(data))
+
+        self.assertEqual(metadata.name, "Show.S01E01.720p")
+        self.assertEqual(metadata.info_hash,
+                         hashlib.sha1(encode(info)).hexdigest())
+        self.assertEqual(metadata.files[2], ("Subs/english.srt", 5))
+        self.assertEqual(
+            metadata.top_level_names,
+            ["show.s01e01.rar", "show.s01e01.r00", "Subs"],
+        )
+
+    def test_buffers_are_read_without_a_copy(self):
+        data = bytearray(encode({"info": {"name": "a", "pieces": b""}}))
+        reader = _Reader(memoryview(data))
+
+        self.assertIs(reader.view.obj, data)
+        self.assertEqual(torrent_metadata(memoryview(data)).name, "a")
+
+    def test_single_file_torrent(self):
+        info = {"name": "episode.mkv", "length": 10, "pieces": b"\x02" * 20}
+        metadata = torrent_metadata(encode({"info": info}))
+        self.assertEqual(metadata.files, [])
+        self.assertEqual(metadata.top_level_names, ["episode.mkv"])
+
+    def test_torrent_without_info(self):
+        with self.assertRaises(BencodeError):
+            torrent_metadata(encode({"announce": "http://tracker/"}))
+        with self.assertRaises(BencodeError):
+            torrent_metadata(b"<html>Not found</html>")
+
+
+if __name__ == "__main__":
+    unittest.main()
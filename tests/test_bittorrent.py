@@ -0,0 +1,187 @@
+from types import ModuleType, SimpleNamespace
+import unittest
+from unittest.mock import MagicMock, patch
+
+from models.bittorrent import BitTorrentClient
+
+
+class ControlManager:
+    """Stand-in for the daemon side; actions are run against it."""
+
+    def __init__(self, torrents=()):
+        self.added = []
+        self.paused = []
+        self.torrents = list(torrents)
+
+    def add(self, torrent_info):
+        if any(t.path == torrent_info.path for t in self.added):
+            raise ValueError("This torrent is already added")
+        self.added.append(torrent_info)
+
+    def pause(self, info_hash):
+        self.paused.append(info_hash)
+
+    def get_torrents(self):
+        return self.torrents
+
+
+class ControlClient:
+    manager = None
+    refuse = False
+    connections = 0
+
+    def __init__(self):
+        self.dropped = False
+
+    async def connect(self):
+        if self.refuse:
+            raise ConnectionRefusedError("refused")
+        type(self).connections += 1
+
+    async def execute(self, action):
+        if self.dropped:
+            raise ConnectionResetError("reset")
+        return action(self.manager)
+
+    def close(self):
+        pass
+
+
+class TorrentInfo:
+
+    def __init__(self, path, download_dir):
+        self.path = path
+        self.download_dir = download_dir
+        self.download_info = SimpleNamespace(info_hash=path.encode())
+
+    @classmethod
+    def from_file(cls, path, download_dir):
+        return cls(path, download_dir)
+
+
+def torrent(info_hash, downloaded, total, paused=False):
+    return SimpleNamespace(
+        paused=paused,
+        download_info=SimpleNamespace(
+            suggested_name=f"Show.{info_hash.hex()}",
+            info_hash=info_hash,
+            complete=downloaded == total,
+            total_size=total,
+            downloaded_size=downloaded,
+            session_statistics=SimpleNamespace(download_speed=1024,
+                                               upload_speed=512),
+        ),
+    )
+
+
+class BitTorrentClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = ControlManager()
+        control = ModuleType("torrent_client.control")
+        control.ControlClient = type("Client", (ControlClient,),
+                                     {"manager": self.manager})
+        control.ControlManager = ControlManager
+        models = ModuleType("torrent_client.models")
+        models.TorrentInfo = TorrentInfo
+        self.modules = {
+            "torrent_client": ModuleType("torrent_client"),
+            "torrent_client.control": control,
+            "torrent_client.models": models,
+        }
+        modules = patch.dict("sys.modules", self.modules)
+        modules.start()
+        self.addCleanup(modules.stop)
+
+        self.jackett = MagicMock()
+        self.client = BitTorrentClient(self.jackett)
+        self.addCleanup(self.client.close)
+
+    def test_add_and_pause(self):
+        self.client.add([("a.torrent", "/tv/A"), ("b.torrent", "/tv/B")])
+        self.client.pause(["a.torrent"])
+
+        self.assertEqual(
+            [(t.path, t.download_dir) for t in self.manager.added],
+            [("a.torrent", "/tv/A"), ("b.torrent", "/tv/B")],
+        )
+        self.assertEqual(self.manager.paused, [b"a.torrent"])
+        self.jackett.start_torrent_transfer.assert_not_called()
+
+    def test_status(self):
+        self.manager.torrents = [
+            torrent(b"\x01\x02", 50, 200),
+            torrent(b"\x03\x04", 200, 200),
+            torrent(b"\x05\x06", 10, 200, paused=True),
+        ]
+        statuses = self.client.status()
+
+        self.assertEqual(
+            [(s.info_hash, s.state, s.progress, s.complete)
+             for s in statuses],
+            [
+                ("0102", "Downloading", 25.0, False),
+                ("0304", "Uploading", 100.0, True),
+                ("0506", "Paused", 5.0, False),
+            ],
+        )
+        self.assertEqual(statuses[0].size_total, 200)
+        self.assertEqual(statuses[0].download_speed, 1024)
+
+    def test_unreachable_daemon_falls_back_to_torrent_cli(self):
+        self.modules["torrent_client.control"].ControlClient.refuse = True
+
+        self.client.add([("a.torrent", "/tv/A")])
+        self.client.pause(["a.torrent"])
+
+        self.assertIsNone(self.client.status())
+        self.jackett.start_torrent_transfer.assert_called_once_with(
+            "a.torrent", "/tv/A"
+        )
+        self.jackett.pause_torrent_transfer.assert_called_once_with(
+            "a.torrent"
+        )
+        self.assertEqual(self.manager.added, [])
+
+    def test_failed_adds_skip_only_their_torrent(self):
+        self.client.add([("a.torrent", "/tv/A")])
+        self.client.add([("a.torrent", "/tv/A"), ("b.torrent", "/tv/B")])
+
+        self.assertEqual([t.path for t in self.manager.added],
+                         ["a.torrent", "b.torrent"])
+        self.jackett.start_torrent_transfer.assert_not_called()
+
+    def test_dropped_connection_reconnects(self):
+        self.client.add([("a.torrent", "/tv/A")])
+        # bit-torrent restarted: the open connection is dead.
+        self.client.client.dropped = True
+
+        self.client.add([("b.torrent", "/tv/B"), ("c.torrent", "/tv/C")])
+
+        self.jackett.start_torrent_transfer.assert_called_once_with(
+            "b.torrent", "/tv/B"
+        )
+        self.assertEqual([t.path for t in self.manager.added],
+                         ["a.torrent", "c.torrent"])
+        self.assertEqual(self.client.client.connections, 2)
+
+    def test_unreachable_daemon_is_retried(self):
+        client = self.modules["torrent_client.control"].ControlClient
+        client.refuse = True
+        self.assertIsNone(self.client.status())
+
+        client.refuse = False
+        self.assertEqual(self.client.status(), [])
+
+    def test_missing_package_falls_back_to_torrent_cli(self):
+        self.modules["torrent_client.control"] = None
+        with patch.dict("sys.modules", self.modules):
+            self.client.add([("a.torrent", "/tv/A")])
+
+        self.jackett.start_torrent_transfer.assert_called_once_with(
+            "a.torrent", "/tv/A"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
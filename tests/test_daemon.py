@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import MagicMock
+
+from models.daemon import Daemon
+
+# Intervals are minutes; keep runs a few milliseconds apart.
+INTERVAL = 0.0001
+
+
+class DaemonTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fetcher = MagicMock()
+        self.extraction_queue = MagicMock()
+        self.daemon = Daemon(
+            self.fetcher,
+            extraction_queue=self.extraction_queue,
+            search_interval=INTERVAL,
+            status_interval=INTERVAL,
+            extraction_interval=60,
+        )
+
+    def _stop_after(self, mock, runs, error=None):
+        def side_effect(*args, **kwargs):
+            if mock.call_count >= runs:
+                self.daemon.stop()
+            if error and mock.call_count == 1:
+                raise error
+        mock.side_effect = side_effect
+
+    def test_tasks_repeat_until_stopped(self):
+        self._stop_after(self.fetcher.download_all_non_complete_episodes, 3)
+        self.daemon.run()
+
+        self.assertGreaterEqual(
+            self.fetcher.download_all_non_complete_episodes.call_count, 3
+        )
+        self.assertGreaterEqual(
+            self.fetcher.check_downloading_torrents.call_count, 1
+        )
+        self.fetcher.torrent_client.close.assert_called_once()
+        self.fetcher.session.close.assert_called_once()
+
+    def test_failed_run_is_rolled_back_and_retried(self):
+        self._stop_after(self.fetcher.download_all_non_complete_episodes, 2,
+                         error=Exception("Jackett server not running!"))
+        self.daemon.run()
+
+        self.fetcher.session.rollback.assert_called()
+        self.assertGreaterEqual(
+            self.fetcher.download_all_non_complete_episodes.call_count, 2
+        )
+
+    def test_status_wakes_extraction(self):
+        # Extraction runs at startup, then again once status has run,
+        # well before its 60 minute interval.
+        self._stop_after(self.extraction_queue.run, 2)
+        self.daemon.run()
+
+        self.assertGreaterEqual(self.extraction_queue.run.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import Column, MetaData, String, create_engine, inspect
+
+from models import db
+from models.db import (
+    Base,
+    Episode,
+    MIGRATIONS,
+    Series,
+    get_engine,
+    get_session,
+    schema_version,
+)
+
+
+class EngineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.uri = "sqlite:///" + os.path.join(self.tmp, "test.db")
+
+    def test_sqlite_pragmas(self):
+        engine = get_engine(self.uri, busy_timeout=1234)
+        with engine.connect() as connection:
+            pragma = lambda name: connection.execute(
+                f"PRAGMA {name}").scalar()
+            self.assertEqual(pragma("journal_mode"), "wal")
+            # NORMAL
+            self.assertEqual(pragma("synchronous"), 1)
+            self.assertEqual(pragma("busy_timeout"), 1234)
+            self.assertEqual(schema_version(connection), len(MIGRATIONS))
+
+    def test_unversioned_database_is_migrated(self):
+        old = create_engine(self.uri)
+        old.execute("CREATE TABLE series (id INTEGER PRIMARY KEY, "
+                    "name VARCHAR)")
+        old.execute("INSERT INTO series (id, name) VALUES (1, 'Lost')")
+        old.dispose()
+
+        session = get_session(self.uri)
+        series = session.query(Series).one()
+        self.assertEqual(series.name, "Lost")
+        self.assertIsNone(series.last_synced_at)
+
+    def test_baseline_does_not_follow_the_models(self):
+        # A model column added by migration 2 must not already be
+        # created by the baseline on new databases.
+        metadata = MetaData()
+        for table in Base.metadata.sorted_tables:
+            table.tometadata(metadata)
+        metadata.tables["series"].append_column(Column("network", String))
+
+        def add_network(connection):
+            connection.execute("ALTER TABLE series ADD COLUMN network VARCHAR")
+
+        with patch.object(Base, "metadata", metadata), \
+                patch.object(db, "MIGRATIONS", MIGRATIONS + [add_network]):
+            engine = get_engine(self.uri)
+            with engine.connect() as connection:
+                self.assertEqual(schema_version(connection), 2)
+                columns = inspect(connection).get_columns("series")
+        self.assertIn("network", [c["name"] for c in columns])
+
+    def test_concurrent_processes_migrate_and_write(self):
+        errors = []
+
+        def add_episodes(series_id):
+            try:
+                session = get_session(self.uri)
+                session.add(Series(id=series_id, name=str(series_id)))
+                for number in range(20):
+                    session.add(Episode(series_id=series_id, id=number))
+                    session.commit()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=add_episodes, args=(series_id,))
+            for series_id in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(get_session(self.uri).query(Episode).count(), 80)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from unittest.mock import patch
+import zipfile
+import zlib
+
+from models.db import EpisodeTorrent, ExtractionJob, get_session
+from models.extraction import DONE, FAILED, ExtractionQueue
+from utils.config_parser import config_parser
+from utils.archives import (
+    ArchiveError,
+    RarVolume,
+    UnsupportedArchive,
+    extract,
+    first_volume,
+)
+
+FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "files")
+
+
+def _extract_or_explode(archive_path, output_folder, backend="auto"):
+    if archive_path.endswith("bad.zip"):
+        raise ValueError("unexpected")
+    return extract(archive_path, output_folder, backend=backend)
+
+
+class ExtractionQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.session = get_session("sqlite://")
+        self.queue = ExtractionQueue(self.session, workers=2, niceness=0,
+                                     ionice=False, background=False)
+        self.torrent = EpisodeTorrent(info_hash="abc", archive_file="a.rar")
+        self.session.add(self.torrent)
+        self.session.commit()
+
+    def _statuses(self):
+        return [job.status for job in self.session.query(ExtractionJob)]
+
+    def test_background_worker_gets_the_config_path(self):
+        queue = ExtractionQueue(self.session, config="config.ini")
+        with patch("subprocess.Popen") as popen:
+            queue.start()
+
+        command = popen.call_args.args[0]
+        self.assertEqual(command[-3:], [
+            "--extract", "--config", os.path.abspath("config.ini"),
+        ])
+
+    def test_queue_from_config_file(self):
+        # from_config_file reads [db] into the shared parser.
+        saved = {name: dict(config_parser[name])
+                 for name in config_parser.sections()}
+
+        def restore():
+            config_parser.clear()
+            config_parser.read_dict(saved)
+        self.addCleanup(restore)
+        config = os.path.join(self.tmp, "config.ini")
+        with open(config, "w") as f:
+            f.write("[db]\nuri = sqlite:///{}\n[extraction]\nworkers = 3\n"
+                    .format(os.path.join(self.tmp, "test.db")))
+        queue = ExtractionQueue.from_config_file(config)
+        self.addCleanup(queue.session.close)
+
+        self.assertEqual(queue.workers, 3)
+        self.assertEqual(queue.config, config)
+        queue.run()
+
+    def test_jobs_are_run_and_recorded(self):
+        archive = os.path.join(self.tmp, "a.zip")
+        with zipfile.ZipFile(archive, "w") as z:
+            z.writestr("episode.mkv", b"x" * 1000)
+        for i in range(3):
+            self.queue.enqueue(self.torrent, archive,
+                               os.path.join(self.tmp, str(i)))
+        self.session.commit()
+        self.queue.start()
+
+        self.assertEqual(self._statuses(), [DONE] * 3)
+        for i, job in enumerate(self.session.query(ExtractionJob)):
+            self.assertEqual(job.backend, "zip")
+            self.assertIsNotNone(job.duration)
+            self.assertIsNotNone(job.finished_at)
+            self.assertTrue(os.path.exists(
+                os.path.join(self.tmp, str(i), "episode.mkv")))
+
+    def test_failed_jobs_record_the_error(self):
+        self.queue.enqueue(self.torrent, "/nonexistent/a.rar", "/tmp")
+        self.session.commit()
+        self.queue.run()
+
+        job, = self.session.query(ExtractionJob)
+        self.assertEqual(job.status, FAILED)
+        self.assertTrue(job.error)
+
+    def test_unexpected_errors_fail_only_their_job(self):
+        archive = os.path.join(self.tmp, "a.zip")
+        with zipfile.ZipFile(archive, "w") as z:
+            z.writestr("episode.mkv", b"x" * 1000)
+        self.queue.enqueue(self.torrent, os.path.join(self.tmp, "bad.zip"),
+                           self.tmp)
+        self.queue.enqueue(self.torrent, archive, os.path.join(self.tmp, "o"))
+        self.session.commit()
+        # Pool workers are forked after the patch, so they see it too.
+        with patch("models.extraction.extract", _extract_or_explode):
+            self.queue.run()
+
+        bad, good = self.session.query(ExtractionJob).order_by(
+            ExtractionJob.id)
+        self.assertEqual(bad.status, FAILED)
+        self.assertEqual(bad.error, "unexpected")
+        self.assertEqual(good.status, DONE)
+
+
+class ArchivesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def _volumes(self):
+        volumes = os.path.join(self.tmp, "volumes")
+        os.mkdir(volumes)
+        for name in os.listdir(FILES):
+            shutil.copy(os.path.join(FILES, name), volumes)
+        return volumes
+
+    def test_first_volume(self):
+        self.assertEqual(first_volume(["a.r00", "a.rar", "a.nfo"]), "a.rar")
+        self.assertEqual(
+            first_volume(["x.part02.rar", "x.part01.rar"]), "x.part01.rar"
+        )
+        self.assertEqual(first_volume(["a.002", "a.001"]), "a.001")
+        self.assertIsNone(first_volume(["a.mkv"]))
+
+    def test_stored_rar_volume_set(self):
+        # Starting from any volume extracts the whole set.
+        backend = extract(os.path.join(FILES, "rar3-old.r00"), self.tmp)
+
+        self.assertEqual(backend, "rar")
+        for name, size in (("bigfile.txt", 205000), ("smallfile.txt", 2050)):
+            path = os.path.join(self.tmp, "vols", name)
+            self.assertEqual(os.path.getsize(path), size)
+
+    def test_rar_crc_mismatch(self):
+        volumes = self._volumes()
+        with open(os.path.join(volumes, "rar3-old.r01"), "r+b") as f:
+            f.seek(-100, os.SEEK_END)
+            f.write(b"corrupt")
+
+        with self.assertRaises(ArchiveError):
+            extract(os.path.join(volumes, "rar3-old.rar"),
+                    os.path.join(self.tmp, "out"), backend="rar")
+
+    def test_truncated_rar_volume(self):
+        volumes = self._volumes()
+        path = os.path.join(volumes, "rar3-old.rar")
+        for size in (10, 30):
+            with open(path, "r+b") as f:
+                f.truncate(size)
+            with self.assertRaises(ArchiveError):
+                extract(path, os.path.join(self.tmp, "out"), backend="rar")
+
+    def test_malformed_rar_header_is_unsupported(self):
+        # A file header block with a valid CRC but no room for its fields.
+        body = struct.pack("<BHH", 0x74, 0, 7 + 4) + b"\0" * 4
+        crc = zlib.crc32(body) & 0xffff
+        path = os.path.join(self.tmp, "malformed.rar")
+        with open(path, "wb") as f:
+            f.write(b"Rar!\x1a\x07\x00" + struct.pack("<H", crc) + body)
+
+        volume = RarVolume(path)
+        self.addCleanup(volume.close)
+        with self.assertRaises(UnsupportedArchive):
+            list(volume.blocks())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from utils.config_parser import config_parser
+from utils.http import PooledSession, _build_session, get_http_session
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answers 503 to the first `failures` requests, then 200."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        status = 503 if server.requests <= server.failures else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPSessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # get_http_session reads [http] into the shared parser.
+        saved = {name: dict(config_parser[name])
+                 for name in config_parser.sections()}
+
+        def restore():
+            config_parser.clear()
+            config_parser.read_dict(saved)
+        self.addCleanup(restore)
+
+    def _server(self, failures):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+        server.requests = 0
+        server.failures = failures
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address[:2]
+        return server, f"http://{host}:{port}/"
+
+    def test_default_timeout_is_applied(self):
+        session = PooledSession(timeout=7)
+        with patch.object(requests.Session, "request") as request:
+            session.get("http://localhost/a")
+            session.get("http://localhost/b", timeout=1)
+
+        self.assertEqual(
+            [call.kwargs["timeout"] for call in request.call_args_list],
+            [7, 1],
+        )
+
+    def test_retries_on_error_status(self):
+        server, url = self._server(failures=2)
+        session = _build_session(pool_size=1, retries=3, backoff_factor=0,
+                                 timeout=5)
+
+        self.assertEqual(session.get(url).status_code, 200)
+        self.assertEqual(server.requests, 3)
+
+    def test_sessions_are_shared_per_settings(self):
+        config = "[http]\npool_size = 3\ntimeout = 11\n"
+        session = get_http_session(config)
+
+        self.assertIs(get_http_session(config), session)
+        self.assertIsNot(
+            get_http_session("[http]\npool_size = 3\ntimeout = 12\n"),
+            session,
+        )
+        self.assertEqual(session.timeout, 11)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+from urllib.request import urlopen
+
+from utils.metrics import MetricsExporter, Registry
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_render(self):
+        self.registry.counter("grabs_total", "Grabs").inc(2)
+        self.registry.gauge("depth", "Depth").set(5, queue="search")
+        histogram = self.registry.histogram("seconds", "Time",
+                                            buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value, stage="fetch")
+
+        lines = self.registry.render().splitlines()
+        self.assertIn("# TYPE torrent_automator_grabs_total counter", lines)
+        self.assertIn("torrent_automator_grabs_total 2", lines)
+        self.assertIn('torrent_automator_depth{queue="search"} 5', lines)
+        self.assertIn(
+            'torrent_automator_seconds_bucket{stage="fetch",le="1"} 3', lines
+        )
+        self.assertIn(
+            'torrent_automator_seconds_bucket{stage="fetch",le="+Inf"} 4',
+            lines,
+        )
+        self.assertIn('torrent_automator_seconds_count{stage="fetch"} 4',
+                      lines)
+        self.assertIn(
+            'seconds{stage="fetch"}: 4 calls, 4.05s total, 1.012s avg, '
+            '3.000s max',
+            self.registry.summary(),
+        )
+
+    def test_metric_types_cannot_change(self):
+        self.registry.counter("searches_total")
+        with self.assertRaises(Exception):
+            self.registry.gauge("searches_total")
+
+    def test_exporter_writes_textfile_per_job_and_serves_http(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.registry.counter("grabs_total").inc()
+        exporter = MetricsExporter(
+            self.registry,
+            textfile=os.path.join(tmp, "metrics.prom"),
+            port=0,
+            summary=False,
+            job="download",
+        )
+        exporter.export()
+        with open(os.path.join(tmp, "metrics_download.prom")) as f:
+            self.assertIn("torrent_automator_grabs_total 1", f.read())
+
+        server = self.registry.serve(0, host="127.0.0.1")
+        self.addCleanup(server.shutdown)
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urlopen(url) as response:
+            self.assertIn(b"torrent_automator_grabs_total 1",
+                          response.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import threading
+import time
+import unittest
+
+from utils.pipeline import Pipeline, Stage
+
+
+class PipelineTestCase(unittest.TestCase):
+
+    def test_items_pass_through_every_stage(self):
+        pipeline = Pipeline([
+            Stage("double", lambda n: n * 2, workers=3),
+            Stage("odd", lambda n: n + 1 if n % 4 else None, workers=2),
+        ], queue_size=2)
+
+        results = sorted(pipeline.run(range(10)))
+
+        self.assertEqual(results, [3, 7, 11, 15, 19])
+        double, odd = pipeline.stages
+        self.assertEqual(double.processed, 10)
+        self.assertEqual(odd.processed, 10)
+        self.assertIn("double: 10 items", pipeline.report()[0])
+
+    def test_slow_stage_does_not_hold_up_earlier_stages(self):
+        searched = []
+        release = threading.Event()
+
+        def search(n):
+            searched.append(n)
+            return n
+
+        def fetch(n):
+            release.wait(1)
+            return n
+
+        pipeline = Pipeline([
+            Stage("search", search, workers=2),
+            Stage("fetch", fetch, workers=1),
+        ], queue_size=8)
+        results = pipeline.run(range(5))
+        thread = threading.Thread(target=lambda: results.__next__())
+        thread.start()
+        time.sleep(0.2)
+
+        self.assertEqual(sorted(searched), list(range(5)))
+        release.set()
+        thread.join()
+        results.close()
+
+    def test_errors_are_counted_and_dropped(self):
+        def fail_on_three(n):
+            if n == 3:
+                raise ValueError(n)
+            return n
+
+        pipeline = Pipeline([Stage("check", fail_on_three)])
+        self.assertEqual(sorted(pipeline.run(range(5))), [0, 1, 2, 4])
+        self.assertEqual(pipeline.stages[0].errors, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from models.db import Series, get_session
+from utils.profiling import Profiler, QueryStats
+
+
+class QueryStatsTestCase(unittest.TestCase):
+
+    def test_statements_are_counted_per_action(self):
+        session = get_session("sqlite://")
+        stats = QueryStats()
+        stats.install()
+        self.addCleanup(stats.uninstall)
+
+        with stats.action("view"):
+            for series_id in range(3):
+                session.query(Series).get(series_id)
+        session.query(Series).all()
+
+        view = stats.actions["view"]
+        self.assertEqual(len(view), 1)
+        [(count, duration)] = view.values()
+        self.assertEqual(count, 3)
+        self.assertGreater(duration, 0)
+        self.assertIn(None, stats.actions)
+        self.assertIn("3 statements (1 distinct)", stats.report("view")[0])
+
+
+class ProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def _profile(self, mode):
+        output = os.path.join(self.tmp, f"profile.{mode}")
+        profiler = Profiler(mode, output, interval=0.001)
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            profiler.start()
+            with profiler.action("work"):
+                worker = threading.Thread(target=time.sleep, args=(0.05,))
+                worker.start()
+                worker.join()
+            profiler.stop()
+        self.assertIn("Profile [work]", stdout.getvalue())
+        return output
+
+    def test_sampler_writes_collapsed_stacks_of_all_threads(self):
+        with open(self._profile("sample")) as f:
+            lines = f.read().splitlines()
+
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertGreater(int(count), 0)
+        self.assertTrue(any("_bootstrap" in line and "run (threading.py"
+                            in line for line in lines))
+
+    def test_cprofile_writes_stats(self):
+        self.assertGreater(os.path.getsize(self._profile("cprofile")), 0)
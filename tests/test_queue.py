@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta
+import unittest
+from unittest.mock import patch
+
+from models.db import Episode, EpisodeTorrent, Series, explain_query_plan
+from models.fetcher import EpisodeFetcher
+from models.jackett import Jackett
+from utils.profiling import QueryStats
+
+
+TEST_CONFIG = """[db]
+uri = sqlite://
+
+[jackett]
+apikey = api_key
+host = http://localhost:9117
+trackers = tracker_a
+torrent_directory = /tmp/
+"""
+
+
+class QueueTestCase(unittest.TestCase):
+
+    @patch.object(Jackett, "check_server_is_running", lambda self: None)
+    def setUp(self):
+        self.fetcher = EpisodeFetcher(TEST_CONFIG)
+        self.session = self.fetcher.session
+        self.session.add(Series(id=1, name="Game of Thrones"))
+        for number in range(1, 5):
+            self.session.add(Episode(
+                id=number,
+                series_id=1,
+                season_number=1,
+                episode_number=number,
+                air_date=datetime(2011, 4, 17) + timedelta(weeks=number),
+            ))
+        self.session.commit()
+
+
+class NonDownloadedEpisodesTestCase(QueueTestCase):
+
+    def _add_torrent(self, episode_id, complete=False, age=timedelta(0)):
+        self.session.add(EpisodeTorrent(
+            info_hash=f"hash{episode_id}{complete}",
+            episode_id=episode_id,
+            complete=complete,
+            created_at=datetime.utcnow() - age,
+        ))
+        self.session.commit()
+
+    def test_complete_and_recent_torrents_are_excluded(self):
+        self._add_torrent(1, complete=True, age=timedelta(days=2))
+        self._add_torrent(2, age=timedelta(minutes=5))
+        self._add_torrent(3, age=timedelta(hours=2))
+
+        episodes = self.fetcher.non_downloaded_episodes().all()
+        self.assertEqual(sorted(ep.id for ep in episodes), [3, 4])
+
+    def test_torrent_probe_uses_covering_index(self):
+        plan = explain_query_plan(
+            self.session,
+            self.fetcher.non_downloaded_episodes(series_ids=[1]),
+        )
+        probes = [line for line in plan if "episode_torrent" in line]
+        self.assertTrue(probes)
+        for line in probes:
+            self.assertIn("COVERING INDEX idx_episode_torrent_episode_id", line)
+
+
+
+class SearchQueueTestCase(QueueTestCase):
+
+    def _add_episode(self, episode_id, **fields):
+        fields.setdefault("season_number", 2)
+        fields.setdefault("episode_number", episode_id)
+        self.session.add(Episode(id=episode_id, series_id=1, **fields))
+        self.session.commit()
+
+    def _queue(self):
+        # Records are read with Core, which doesn't autoflush.
+        self.session.commit()
+        return [ep.id for ep in self.fetcher.search_queue_records()]
+
+    def test_unaired_special_and_unnumbered_episodes_are_not_searched(self):
+        self._add_episode(5, air_date=None)
+        self._add_episode(6, air_date=datetime.utcnow() + timedelta(days=1))
+        self._add_episode(7, air_date=datetime.utcnow() - timedelta(hours=1))
+        self._add_episode(8, air_date=datetime(2012, 1, 1), season_number=0)
+        self._add_episode(9, air_date=datetime(2011, 1, 1), season_number=None)
+        self._add_episode(10, air_date=datetime(2011, 1, 1),
+                          episode_number=None)
+
+        self.assertEqual(self._queue(), [4, 3, 2, 1])
+
+    def test_failed_searches_back_off_and_lose_priority(self):
+        schedule = self.fetcher.schedule
+        now = datetime.utcnow()
+        episode = self.session.query(Episode).get((1, 4))
+
+        schedule.record_failure(episode, now=now - timedelta(hours=2))
+        self.assertEqual(self._queue(), [3, 2, 1, 4])
+
+        schedule.record_failure(episode, now=now - timedelta(hours=1))
+        self.assertEqual(episode.next_search_at, now + timedelta(hours=1))
+        self.assertEqual(self._queue(), [3, 2, 1])
+
+        schedule.record_success(episode)
+        self.assertEqual(self._queue(), [4, 3, 2, 1])
+
+    def test_queue_is_read_in_one_query(self):
+        stats = QueryStats()
+        stats.install()
+        self.addCleanup(stats.uninstall)
+        with stats.action("queue"):
+            names = [ep.indexed_name
+                     for ep in self.fetcher.search_queue_records()]
+
+        self.assertEqual(names[0], "Game of Thrones s01e04")
+        self.assertEqual(len(stats.actions["queue"]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
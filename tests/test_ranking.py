@@ -0,0 +1,74 @@
+import unittest
+
+from models.ranking import MB, ResultRanker
+
+
+def result(title, seeders, peers=None, size_mb=500):
+    return {
+        "Title": title,
+        "Seeders": seeders,
+        "Peers": seeders if peers is None else peers,
+        "Size": size_mb * MB,
+    }
+
+
+NAMES = ["Game of Thrones s01e01", "Game of E01"]
+
+
+class ResultRankerTestCase(unittest.TestCase):
+
+    def test_defaults_prefer_most_seeders(self):
+        results = [
+            result("Game.of.Thrones.S01E01.720p", 83),
+            result("Game.of.Thrones.S01E01.720p", 100),
+        ]
+        ranked = ResultRanker().rank(results, NAMES)
+        self.assertEqual([r["Seeders"] for r in ranked], [100, 83])
+
+    def test_smaller_less_contended_torrent_wins(self):
+        results = [
+            result("Game.of.Thrones.S01E01.2160p", 120, peers=900,
+                   size_mb=30000),
+            result("Game.of.Thrones.S01E01.720p", 80, size_mb=900),
+        ]
+        ranked = ResultRanker().rank(results, NAMES)
+        self.assertEqual(ranked[0]["Seeders"], 80)
+
+    def test_mismatched_and_oversized_results_are_dropped(self):
+        ranker = ResultRanker(require_match=True, max_size_mb=2000)
+        results = [
+            result("Game.of.Thrones.S01E02.720p", 500),
+            result("Game.of.Thrones.S01E01.1080p", 50, size_mb=4000),
+            result("Game of Thrones - E01 - Winter is Coming", 5),
+        ]
+        ranked = ranker.rank(results, NAMES)
+        self.assertEqual([r["Seeders"] for r in ranked], [5])
+
+    def test_preferred_resolution_and_codec(self):
+        ranker = ResultRanker(resolutions=("1080p", "720p"),
+                              codecs=("x265",))
+        results = [
+            result("Game.of.Thrones.S01E01.720p.x264", 40),
+            result("Game.of.Thrones.S01E01.1080p.x265", 30),
+        ]
+        ranked = ranker.rank(results, NAMES)
+        self.assertEqual(ranked[0]["Seeders"], 30)
+
+    def test_series_config_overrides_defaults(self):
+        config = "\n".join([
+            "[ranking]",
+            "max_size_mb = 2000",
+            "resolutions = 1080p,720p",
+            "",
+            "[ranking.121361]",
+            "resolutions = 720p",
+        ])
+        default = ResultRanker.from_config(config)
+        series = ResultRanker.from_config(config, 121361)
+        self.assertEqual(default.resolutions, ("1080p", "720p"))
+        self.assertEqual(series.resolutions, ("720p",))
+        self.assertEqual(series.max_size_mb, 2000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+import unittest
+
+from models.db import Episode, Series, get_session
+from models.reads import EpisodeRecord, latest_episodes
+
+
+class ReadsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.session = get_session("sqlite://")
+        self.session.add(Series(id=1, name="Game of Thrones: A Show"))
+        self.session.add(Series(id=2, name="Empty"))
+        for number in range(1, 6):
+            self.session.add(Episode(
+                id=number,
+                series_id=1,
+                season_number=1,
+                episode_number=number,
+                air_date=datetime(2011, 4, 17) + timedelta(weeks=number),
+                overview="x" * 1000,
+            ))
+        self.session.commit()
+
+    def test_latest_episodes_are_ranked_per_series(self):
+        rows = latest_episodes(self.session, per_series=3)
+
+        self.assertEqual(
+            [(series_id, rank, number)
+             for series_id, _, rank, number, _ in rows],
+            [(1, 1, 5), (1, 2, 4), (1, 3, 3), (2, None, None)],
+        )
+
+    def test_records_match_episodes(self):
+        query = EpisodeRecord.project(self.session.query(Episode))
+        self.assertNotIn("overview", str(query.statement))
+
+        records = EpisodeRecord.fetch(self.session,
+                                      query.order_by(Episode.id))
+        episode = self.session.query(Episode).get((1, 2))
+        record = records[1]
+        self.assertEqual(record.series_name, "Game of Thrones: A Show")
+        self.assertEqual(record.indexed_name, episode.indexed_name)
+        self.assertEqual(
+            record.shortened_indexed_name(season="z_season"),
+            episode.shortened_indexed_name(season="z_season"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
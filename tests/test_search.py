@@ -0,0 +1,291 @@
+from datetime import datetime, timedelta
+import json
+import threading
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from models.db import (
+    Episode,
+    EpisodeTorrent,
+    SearchResultCache,
+    Series,
+    SeriesExclusion,
+)
+from models.fetcher import EpisodeFetcher
+from models.jackett import Jackett
+from utils.profiling import QueryStats
+
+
+TEST_CONFIG = """[db]
+uri = sqlite://
+
+[jackett]
+apikey = api_key
+host = http://localhost:9117
+trackers = tracker_a,tracker_b
+torrent_directory = /tmp/
+search_workers = 4
+indexer_concurrency = 2
+"""
+
+
+class FetcherTestCase(unittest.TestCase):
+
+    @patch.object(Jackett, "check_server_is_running", lambda self: None)
+    def setUp(self):
+        self.fetcher = EpisodeFetcher(TEST_CONFIG)
+        session = self.fetcher.session
+        session.add(Series(id=1, name="Game of Thrones"))
+        for number in range(1, 9):
+            session.add(Episode(
+                id=number,
+                series_id=1,
+                season_number=1,
+                episode_number=number,
+                air_date=datetime(2011, 4, 17),
+            ))
+        session.commit()
+
+
+class SearchConcurrencyTestCase(FetcherTestCase):
+
+    def test_searches_respect_indexer_concurrency(self):
+        lock = threading.Lock()
+        in_flight = []
+        peak = []
+        searched = []
+
+        def mock_get(url, params=None, **kwargs):
+            search_str = params["Query"]
+            with lock:
+                in_flight.append(search_str)
+                peak.append(len(in_flight))
+                searched.append(search_str)
+            time.sleep(0.02)
+            with lock:
+                in_flight.remove(search_str)
+            content = json.dumps({"Results": [{"Title": search_str}]})
+            return Mock(status_code=200, content=content)
+
+        episodes = self.fetcher.search_queue_records()
+        with patch.object(self.fetcher.jackett.http, "get", mock_get):
+            self.fetcher._download_episodes(episodes, set(), [])
+
+        self.assertEqual(sorted(searched),
+                         sorted(ep.indexed_name for ep in episodes))
+        self.assertGreater(max(peak), 1)
+        self.assertLessEqual(max(peak), 2)
+
+
+class SearchCacheTestCase(FetcherTestCase):
+
+    def _episode(self):
+        return self.fetcher.session.query(Episode).get((1, 1))
+
+    def test_negative_results_are_not_searched_again(self):
+        episode = self._episode()
+        with patch.object(Jackett, "search", return_value=[]) as search:
+            self.assertEqual(self.fetcher.search(episode), [])
+            self.assertEqual(self.fetcher.search(episode), [])
+        self.assertEqual(search.call_count, 1)
+
+    def test_expired_results_are_searched_again(self):
+        episode = self._episode()
+        with patch.object(Jackett, "search", return_value=[{"id": 1}]) as search:
+            self.fetcher.search(episode)
+            entry = self.fetcher.session.query(SearchResultCache).one()
+            entry.created_at -= timedelta(minutes=61)
+            self.assertEqual(self.fetcher.search(episode), [{"id": 1}])
+        self.assertEqual(search.call_count, 2)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = self.fetcher.search_cache
+        cache.max_entries = 2
+        for i in range(4):
+            cache.set(f"query {i}", ["tracker_a"], [{"id": i}])
+            entry = cache._entry(f"query {i}", ["tracker_a"])
+            entry.accessed_at = datetime(2019, 1, 1, 0, i)
+        self.fetcher.session.commit()
+        cache.evict()
+
+        self.assertIsNone(cache.get("query 0", ["tracker_a"]))
+        self.assertIsNone(cache.get("query 1", ["tracker_a"]))
+        self.assertEqual(cache.get("query 3", ["tracker_a"]), [{"id": 3}])
+
+    def test_eviction_keeps_max_entries_despite_ties(self):
+        cache = self.fetcher.search_cache
+        cache.max_entries = 2
+        for i in range(4):
+            cache.set(f"query {i}", ["tracker_a"], [{"id": i}])
+            entry = cache._entry(f"query {i}", ["tracker_a"])
+            entry.accessed_at = datetime(2019, 1, 1)
+        self.fetcher.session.commit()
+        cache.evict()
+
+        self.assertEqual(
+            self.fetcher.session.query(SearchResultCache).count(), 2
+        )
+
+
+
+class DownloadPipelineTestCase(FetcherTestCase):
+
+    @staticmethod
+    def search(search_str):
+        if search_str.endswith("e01"):
+            return []
+        filename = "_".join(search_str.split())
+        return [{
+            "Title": search_str,
+            "Seeders": 10,
+            "Link": f"http://localhost:9117/dl/?path=abc&file={filename}",
+        }]
+
+    @staticmethod
+    def torrent_info(torrent_file):
+        return {
+            "suggested_name": torrent_file,
+            "archive_file": None,
+            "info_hash": torrent_file,
+        }
+
+    def test_episodes_are_downloaded_and_failures_recorded(self):
+        fetcher = self.fetcher
+        episodes = fetcher.search_queue_records()
+        transfers = []
+        with patch.object(Jackett, "search", side_effect=self.search), \
+                patch.object(Jackett, "download_torrent",
+                             side_effect=lambda name, result: (
+                                 result["Title"], result["Title"])), \
+                patch.object(EpisodeFetcher, "_torrent_info",
+                             side_effect=self.torrent_info):
+            fetcher._download_episodes(episodes, set(), transfers)
+
+        torrents = fetcher.session.query(EpisodeTorrent).all()
+        self.assertEqual(len(torrents), 7)
+        self.assertEqual(len(transfers), 7)
+        missing = fetcher.session.query(Episode).get((1, 1))
+        self.assertEqual(missing.search_attempts, 1)
+        self.assertIsNotNone(missing.next_search_at)
+
+    def _statements_per_run(self):
+        stats = QueryStats()
+        stats.install()
+        self.addCleanup(stats.uninstall)
+        with patch.object(Jackett, "search", side_effect=self.search), \
+                patch.object(Jackett, "download_torrent",
+                             side_effect=lambda name, result: (
+                                 result["Title"], result["Title"])), \
+                patch.object(EpisodeFetcher, "_torrent_info",
+                             side_effect=self.torrent_info), \
+                stats.action("download"):
+            self.fetcher.download_all_non_complete_episodes(
+                pause_transfer=True
+            )
+        return [count for count, _ in stats.actions["download"].values()]
+
+    def test_runs_issue_a_constant_number_of_statements(self):
+        # One batch per run.
+        self.fetcher.save_every = 100
+        small = self._statements_per_run()
+        self.assertEqual(self.fetcher.session.query(EpisodeTorrent).count(),
+                         7)
+
+        session = self.fetcher.session
+        for number in range(9, 41):
+            session.add(Episode(id=number, series_id=1, season_number=2,
+                                episode_number=number,
+                                air_date=datetime(2012, 4, 17)))
+        session.commit()
+        large = self._statements_per_run()
+
+        self.assertEqual(session.query(EpisodeTorrent).count(), 39)
+        self.assertEqual(set(small), {1})
+        self.assertEqual(sum(large), sum(small))
+
+    def test_grabs_are_saved_in_batches(self):
+        self.fetcher.save_every = 2
+        batches = []
+        save_downloads = EpisodeFetcher._save_downloads
+
+        def record_batch(fetcher):
+            batches.append(len(fetcher._grabs))
+            save_downloads(fetcher)
+
+        with patch.object(EpisodeFetcher, "_save_downloads", record_batch):
+            self._statements_per_run()
+
+        self.assertEqual(sum(batches), 7)
+        self.assertLessEqual(max(batches), 2)
+        self.assertGreaterEqual(len([b for b in batches if b]), 4)
+
+    def test_failed_runs_start_no_transfers(self):
+        with patch.object(EpisodeFetcher, "_download_episodes",
+                          side_effect=RuntimeError("pipeline")), \
+                patch.object(EpisodeFetcher, "_start_transfers") as start:
+            with self.assertRaisesRegex(RuntimeError, "pipeline"):
+                self.fetcher.download_all_non_complete_episodes()
+
+        start.assert_not_called()
+
+
+class BestResultTestCase(FetcherTestCase):
+
+    @staticmethod
+    def result(filename):
+        return {
+            "Link": (
+                "http://localhost:9117/dl/tracker_a/"
+                f"?jackett_apikey=api_key&path=abc&file={filename}"
+            ),
+        }
+
+    def test_best_result_skips_excluded_and_known_filenames(self):
+        session = self.fetcher.session
+        session.add(SeriesExclusion(series_id=1, filename="excluded"))
+        session.add(EpisodeTorrent(info_hash="abc", episode_id=1,
+                                   filename="known"))
+        session.commit()
+
+        results = [self.result(f) for f in ("excluded", "known", "new")]
+        excluded = self.fetcher.excluded_filenames
+        self.assertEqual(excluded, {"excluded"})
+        best = self.fetcher._best_result(results, excluded)
+        self.assertEqual(best["filename"], "new")
+
+        self.fetcher._add_known_filename("new")
+        self.assertIsNone(self.fetcher._best_result(results, excluded))
+
+    def test_best_result_dedupes_by_info_hash(self):
+        self.fetcher.session.add(EpisodeTorrent(info_hash="a" * 40,
+                                                episode_id=1))
+        self.fetcher.session.commit()
+        known = dict(self.result("known"), InfoHash="A" * 40)
+        magnet_only = {
+            "Link": None,
+            "MagnetUri": "magnet:?xt=urn:btih:" + "b" * 40 + "&dn=episode",
+        }
+        no_file = {
+            "Link": "http://localhost:9117/dl/tracker_a/?path=abc",
+            "MagnetUri": "magnet:?xt=urn:btih:" + "C" * 32,
+        }
+
+        best = self.fetcher._best_result([known, magnet_only, no_file], set())
+        self.assertIs(best, no_file)
+        self.assertEqual(best["info_hash"], "10842108421084210842" * 2)
+        self.assertEqual(best["filename"], best["info_hash"])
+
+    def test_best_result_skips_malformed_base32_info_hashes(self):
+        malformed = {
+            "Link": "http://localhost:9117/dl/tracker_a/?path=abc",
+            "MagnetUri": "magnet:?xt=urn:btih:" + "1" * 32,
+        }
+        valid = self.result("valid")
+
+        best = self.fetcher._best_result([malformed, valid], set())
+        self.assertIs(best, valid)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+from unittest.mock import patch
+
+from models.db import Episode, EpisodeTorrent, Series
+from models.fetcher import EpisodeFetcher
+from models.jackett import Jackett
+from models.status import UNITS, TorrentStatus, parse_statuses
+
+MB = UNITS["MiB"]
+
+TORRENT_STATUS = """Name: {name}
+ID: {info_hash}
+State: Downloading
+Download speed: {ds}/s        Upload speed: None/s
+Size: {completed} MiB/140.0 MiB     Ratio: 0.5
+Progress: {percent}%
+"""
+
+
+class ParseStatusesTestCase(unittest.TestCase):
+
+    def test_blocks_are_parsed_into_numbers(self):
+        output = "\n".join([
+            TORRENT_STATUS.format(name="Show.S01E01", info_hash="aa",
+                                  ds="10 MiB", completed="28.0",
+                                  percent="20.0"),
+            TORRENT_STATUS.format(name="Show.S01E02", info_hash="bb",
+                                  ds="None", completed="140.0",
+                                  percent="100.0"),
+        ])
+        first, second = parse_statuses(output.encode())
+
+        self.assertEqual(first.name, "Show.S01E01")
+        self.assertEqual(first.info_hash, "aa")
+        self.assertEqual(first.state, "Downloading")
+        self.assertEqual(first.download_speed, 10 * MB)
+        self.assertIsNone(first.upload_speed)
+        self.assertEqual(first.size_completed, 28 * MB)
+        self.assertEqual(first.size_total, 140 * MB)
+        self.assertEqual(first.ratio, 0.5)
+        self.assertEqual(first.progress, 20.0)
+        self.assertFalse(first.complete)
+        self.assertIsNone(second.download_speed)
+        self.assertTrue(second.complete)
+
+    def test_progress_need_not_be_last(self):
+        output = iter([
+            "Name: Show.S01E01\n",
+            "Progress: 100.0%  [==========]\n",
+            "ID: aa\n",
+            "Name: Show.S01E02\n",
+            "ID: bb\n",
+        ])
+        first, second = parse_statuses(output)
+        self.assertEqual((first.info_hash, first.progress), ("aa", 100.0))
+        self.assertEqual((second.info_hash, second.progress), ("bb", None))
+
+
+
+TEST_CONFIG = """[db]
+uri = sqlite://
+
+[jackett]
+apikey = api_key
+host = http://localhost:9117
+trackers = tracker_a
+torrent_directory = /tmp/
+"""
+
+
+class CheckDownloadingTorrentsTestCase(unittest.TestCase):
+
+    @patch.object(Jackett, "check_server_is_running", lambda self: None)
+    def setUp(self):
+        self.fetcher = EpisodeFetcher(TEST_CONFIG)
+        session = self.fetcher.session
+        session.add(Series(id=1, name="Show"))
+        for number in (1, 2, 3):
+            session.add(Episode(id=number, series_id=1, season_number=1,
+                                episode_number=number))
+            session.add(EpisodeTorrent(info_hash=f"hash{number}",
+                                       episode_id=number,
+                                       torrent_name=f"Show.S01E0{number}"))
+        session.commit()
+
+    def test_statuses_are_reconciled_by_info_hash(self):
+        statuses = [
+            TorrentStatus(info_hash="hash1", progress=100.0),
+            TorrentStatus(info_hash="hash2", progress=40.0),
+            TorrentStatus(info_hash="other", progress=100.0),
+        ]
+        with patch.object(EpisodeFetcher, "torrent_statuses",
+                          return_value=statuses):
+            missing = self.fetcher.check_downloading_torrents()
+
+        self.assertEqual([t.info_hash for t in missing], ["hash3"])
+        complete = {
+            t.info_hash: t.complete
+            for t in self.fetcher.session.query(EpisodeTorrent)
+        }
+        self.assertEqual(complete, {"hash1": True, "hash2": False,
+                                    "hash3": False})
+
+    def test_every_torrent_is_missing_when_the_client_has_none(self):
+        with patch.object(EpisodeFetcher, "torrent_statuses",
+                          return_value=[]), \
+                patch.object(EpisodeFetcher, "_requeue") as requeue:
+            missing = self.fetcher.check_downloading_torrents(
+                requeue_missing=True
+            )
+
+        self.assertEqual(sorted(t.info_hash for t in missing),
+                         ["hash1", "hash2", "hash3"])
+        requeue.assert_called_once_with(missing)
+
+    def test_nothing_is_missing_when_the_client_is_unreachable(self):
+        self.fetcher.torrent_client.available = False
+        with patch.object(Jackett, "bittorrent_cli_status",
+                          return_value=(None, b"Connection refused")), \
+                patch.object(EpisodeFetcher, "_requeue") as requeue:
+            missing = self.fetcher.check_downloading_torrents(
+                requeue_missing=True
+            )
+
+        self.assertEqual(missing, [])
+        requeue.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+import json
+import unittest
+from unittest.mock import Mock, patch
+
+from models.db import Episode, Series
+from models.tvdb import TVDBAPI
+
+
+TEST_CONFIG = """[db]
+uri = sqlite://
+
+[thetvdb.com]
+ENDPOINT = https://api.thetvdb.com
+APIKEY = key
+requests_per_second = 0
+"""
+
+
+def tvdb_episode(episode_id, number, name, first_aired="2011-04-17",
+                 series_id=1):
+    return {
+        "id": episode_id,
+        "seriesId": series_id,
+        "airedSeason": 1,
+        "airedEpisodeNumber": number,
+        "episodeName": name,
+        "firstAired": first_aired,
+        "overview": None,
+    }
+
+
+class InsertEpisodesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.api = TVDBAPI(TEST_CONFIG)
+        self.series = Series(id=1, name="Game of Thrones")
+        self.api.session.add(self.series)
+        self.api.session.commit()
+
+    def test_insert_then_update_changed_episodes(self):
+        page = [
+            tvdb_episode(1, 1, "Winter is Coming"),
+            tvdb_episode(2, 2, "The Kingsroad", first_aired=""),
+        ]
+        self.assertEqual(self.api._insert_episodes(self.series, page), (2, 0))
+
+        page[1] = tvdb_episode(2, 2, "The Kingsroad", "2011-04-24")
+        page.append(tvdb_episode(3, 3, "Lord Snow"))
+        self.assertEqual(self.api._insert_episodes(self.series, page), (1, 1))
+        self.assertEqual(self.api._insert_episodes(self.series, page), (0, 0))
+
+        episode = self.api.session.query(Episode).get((1, 2))
+        self.assertEqual(episode.air_date, datetime(2011, 4, 24))
+        self.assertEqual(self.api.session.query(Episode).count(), 3)
+
+
+
+class SyncSeriesEpisodesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.api = TVDBAPI(TEST_CONFIG)
+        self.api.jwt_token = "token"
+        self.updated = []
+        self.requested = []
+        for series_id in (1, 2, 3):
+            self.api.session.add(Series(id=series_id, name=str(series_id)))
+        self.api.session.commit()
+
+    def mock_get(self, url, headers=None, params=None):
+        """Every series has two pages of two episodes."""
+        if url.endswith("/updated/query"):
+            data = [{"id": i, "lastUpdated": params["toTime"]}
+                    for i in self.updated]
+            return Mock(status_code=200, content=json.dumps({"data": data}))
+
+        series_id = int(url.split("/")[-2])
+        self.requested.append(series_id)
+        page = params.get("page", 1)
+        data = [
+            tvdb_episode(series_id * 100 + page * 10 + n, n, "ep",
+                         series_id=series_id)
+            for n in (1, 2)
+        ]
+        links = {"next": 2 if page == 1 else None}
+        content = json.dumps({"data": data, "links": links})
+        return Mock(status_code=200, content=content)
+
+    def test_add_series_episodes_follows_every_page(self):
+        with patch.object(self.api.http, "get", self.mock_get):
+            self.api.add_series_episodes()
+
+        session = self.api.session
+        self.assertEqual(session.query(Episode).count(), 12)
+        self.assertEqual(
+            [series.pages for series in session.query(Series)],
+            [2, 2, 2],
+        )
+
+    def test_add_series_episodes_skips_unchanged_series(self):
+        with patch.object(self.api.http, "get", self.mock_get):
+            self.api.add_series_episodes()
+            for series in self.api.session.query(Series):
+                series.last_synced_at -= timedelta(hours=1)
+            self.requested.clear()
+            self.updated = [2]
+            self.api.add_series_episodes()
+
+        # Changed series are re-read from the first page.
+        self.assertEqual(self.requested, [2, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,381 @@
+"""
+Archive extraction backends.
+
+Scene releases are almost always split, uncompressed ("store") RAR3
+volume sets, which can be extracted by copying member data straight
+out of each volume. The native backends stream members to disk through
+a bounded buffer and verify CRCs as they go; anything they can't handle
+(compressed or encrypted RAR, 7z, ...) falls back to the 7z binary.
+"""
+import os
+import re
+import shutil
+import struct
+import subprocess
+import zipfile
+import zlib
+
+CHUNK_SIZE = 1024 * 1024
+
+RAR_MARKER = b"Rar!\x1a\x07\x00"
+
+# RAR 1.5-4.x block types and flags.
+MAIN_HEAD = 0x73
+FILE_HEAD = 0x74
+ENDARC_HEAD = 0x7b
+LONG_BLOCK = 0x8000
+MHD_VOLUME = 0x0001
+MHD_PASSWORD = 0x0080
+MHD_FIRSTVOLUME = 0x0100
+MHD_NEWNUMBERING = 0x0010
+EARC_NEXT_VOLUME = 0x0001
+LHD_SPLIT_BEFORE = 0x01
+LHD_SPLIT_AFTER = 0x02
+LHD_PASSWORD = 0x04
+LHD_DIRECTORY = 0xe0
+LHD_LARGE = 0x100
+LHD_UNICODE = 0x200
+METHOD_STORE = 0x30
+
+_part = re.compile(r"^(?P<base>.*)\.part(?P<number>\d+)\.rar$", re.I)
+_old_volume = re.compile(r"^(?P<base>.*)\.(?P<letter>[r-z])(?P<number>\d\d)$",
+                         re.I)
+_split = re.compile(r"^(?P<base>.*)\.(?P<number>\d{3})$")
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class UnsupportedArchive(ArchiveError):
+    pass
+
+
+def first_volume(filenames):
+    """
+    The archive to extract from a list of filenames, e.g. a torrent's
+    file tree: the first volume of a RAR set (.rar, or .part1.rar with
+    new style naming), else a .zip or .7z, else the lowest .rNN or
+    .NNN split part.
+    """
+    by_priority = []
+    for filename in filenames:
+        lower = filename.lower()
+        part = _part.match(filename)
+        if part:
+            by_priority.append(((0, int(part.group("number"))), filename))
+        elif lower.endswith(".rar"):
+            by_priority.append(((0, 0), filename))
+        elif lower.endswith((".zip", ".7z")):
+            by_priority.append(((1, 0), filename))
+        elif _old_volume.match(filename) or _split.match(filename):
+            digits = "".join(c for c in filename[-3:] if c.isdigit())
+            by_priority.append(((2, int(digits)), filename))
+    if not by_priority:
+        return None
+    return min(by_priority)[1]
+
+
+def next_rar_volume(path, new_numbering):
+    """Filename of the volume following `path` in a RAR volume set."""
+    directory, filename = os.path.split(path)
+    part = _part.match(filename)
+    if new_numbering and part:
+        number = part.group("number")
+        next_number = str(int(number) + 1).zfill(len(number))
+        return os.path.join(
+            directory, f"{part.group('base')}.part{next_number}.rar"
+        )
+
+    if filename.lower().endswith(".rar"):
+        return os.path.join(directory, filename[:-4] + ".r00")
+    volume = _old_volume.match(filename)
+    if not volume:
+        raise ArchiveError(f"Can't name the volume after {filename}")
+    letter, number = volume.group("letter"), int(volume.group("number")) + 1
+    if number == 100:
+        letter, number = chr(ord(letter) + 1), 0
+    return os.path.join(
+        directory, f"{volume.group('base')}.{letter}{number:02d}"
+    )
+
+
+def _safe_path(output_folder, name):
+    name = name.replace("\\", "/")
+    parts = [p for p in name.split("/") if p not in ("", ".")]
+    if not parts or ".." in parts or os.path.isabs(name):
+        raise ArchiveError(f"Unsafe member name: {name}")
+    return os.path.join(output_folder, *parts)
+
+
+class RarBlock:
+    __slots__ = ("type", "flags", "pack_size", "crc", "method", "name",
+                 "data_offset")
+
+
+class RarVolume:
+    """Block headers of a single RAR3 volume, read without the data."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        if self.file.read(len(RAR_MARKER)) != RAR_MARKER:
+            self.file.close()
+            raise UnsupportedArchive(f"{path} is not a RAR 1.5-4.x archive")
+        self.flags = 0
+
+    def close(self):
+        self.file.close()
+
+    def blocks(self):
+        f = self.file
+        while True:
+            header = f.read(7)
+            if not header:
+                return
+            if len(header) < 7:
+                raise ArchiveError(f"{self.path} is truncated")
+            head_crc, head_type, flags, head_size = struct.unpack(
+                "<HBHH", header
+            )
+            if head_size < 7:
+                raise ArchiveError(f"Corrupt block header in {self.path}")
+            rest = f.read(head_size - 7)
+            if len(rest) < head_size - 7:
+                raise ArchiveError(f"{self.path} is truncated")
+            if zlib.crc32(header[2:] + rest) & 0xffff != head_crc:
+                raise ArchiveError(f"Corrupt block header in {self.path}")
+
+            block = RarBlock()
+            block.type = head_type
+            block.flags = flags
+            block.pack_size = 0
+            try:
+                if head_type == FILE_HEAD:
+                    self._parse_file_header(block, rest)
+                elif flags & LONG_BLOCK:
+                    block.pack_size, = struct.unpack_from("<I", rest)
+            except struct.error:
+                # A header too short for its type; let 7z have a go.
+                raise UnsupportedArchive(
+                    f"Malformed block header in {self.path}"
+                )
+            if head_type == MAIN_HEAD:
+                self.flags = flags
+            block.data_offset = f.tell()
+            yield block
+            f.seek(block.data_offset + block.pack_size)
+            if head_type == ENDARC_HEAD:
+                return
+
+    @staticmethod
+    def _parse_file_header(block, rest):
+        (pack_size, unp_size, host_os, file_crc, ftime, unp_ver, method,
+         name_size, attr) = struct.unpack_from("<IIBIIBBHI", rest)
+        offset = 25
+        if block.flags & LHD_LARGE:
+            high_pack, high_unp = struct.unpack_from("<II", rest, offset)
+            pack_size |= high_pack << 32
+            offset += 8
+        name = rest[offset:offset + name_size]
+        if block.flags & LHD_UNICODE:
+            name = name.split(b"\0", 1)[0]
+        block.pack_size = pack_size
+        block.crc = file_crc
+        block.method = method
+        block.name = name.decode("utf-8", errors="replace")
+
+
+class RarStoreBackend:
+    """
+    Extracts uncompressed RAR 1.5-4.x archives and volume sets natively.
+    Given any volume, extraction starts from the set's first volume.
+    """
+    name = "rar"
+
+    def _first_volume_path(self, archive_path):
+        volume = RarVolume(archive_path)
+        try:
+            for block in volume.blocks():
+                break
+        finally:
+            volume.close()
+        flags = volume.flags
+        if not flags & MHD_VOLUME or flags & MHD_FIRSTVOLUME:
+            return archive_path
+
+        directory, filename = os.path.split(archive_path)
+        part = _part.match(filename)
+        old = _old_volume.match(filename)
+        if part:
+            number = part.group("number")
+            candidate = f"{part.group('base')}.part{'1'.zfill(len(number))}.rar"
+        elif old:
+            candidate = old.group("base") + ".rar"
+        else:
+            raise ArchiveError(f"Can't find the first volume of {filename}")
+        return os.path.join(directory, candidate)
+
+    def extract(self, archive_path, output_folder):
+        path = self._first_volume_path(archive_path)
+        out = None
+        file_crc = part_crc = 0
+        try:
+            while path:
+                volume = RarVolume(path)
+                try:
+                    more_volumes = False
+                    for block in volume.blocks():
+                        if volume.flags & MHD_PASSWORD:
+                            raise UnsupportedArchive("Encrypted headers")
+                        if block.type == ENDARC_HEAD:
+                            more_volumes = bool(block.flags & EARC_NEXT_VOLUME)
+                        if block.type != FILE_HEAD:
+                            continue
+                        if block.flags & LHD_PASSWORD:
+                            raise UnsupportedArchive("Encrypted member")
+                        if block.method != METHOD_STORE:
+                            raise UnsupportedArchive("Compressed member")
+
+                        target = _safe_path(output_folder, block.name)
+                        if block.flags & LHD_DIRECTORY == LHD_DIRECTORY:
+                            os.makedirs(target, exist_ok=True)
+                            continue
+                        if not block.flags & LHD_SPLIT_BEFORE:
+                            os.makedirs(os.path.dirname(target),
+                                        exist_ok=True)
+                            out = open(target, "wb")
+                            file_crc = 0
+                        elif out is None:
+                            raise ArchiveError(
+                                f"{block.name} continues a missing volume"
+                            )
+
+                        part_crc = 0
+                        volume.file.seek(block.data_offset)
+                        remaining = block.pack_size
+                        while remaining:
+                            chunk = volume.file.read(
+                                min(CHUNK_SIZE, remaining)
+                            )
+                            if not chunk:
+                                raise ArchiveError(f"{path} is truncated")
+                            remaining -= len(chunk)
+                            part_crc = zlib.crc32(chunk, part_crc)
+                            file_crc = zlib.crc32(chunk, file_crc)
+                            out.write(chunk)
+
+                        # Split parts carry the CRC of their own data; the
+                        # final part carries the CRC of the whole file.
+                        if block.flags & LHD_SPLIT_AFTER:
+                            if part_crc != block.crc:
+                                raise ArchiveError(
+                                    f"CRC mismatch in {block.name} ({path})"
+                                )
+                            continue
+                        out.close()
+                        out = None
+                        if file_crc != block.crc:
+                            raise ArchiveError(f"CRC mismatch in {block.name}")
+
+                    new_numbering = bool(volume.flags & MHD_NEWNUMBERING)
+                    if not volume.flags & MHD_VOLUME:
+                        more_volumes = False
+                    elif out is not None:
+                        more_volumes = True
+                finally:
+                    volume.close()
+
+                path = next_rar_volume(path, new_numbering) \
+                    if more_volumes else None
+                if path and not os.path.exists(path):
+                    raise ArchiveError(f"Missing volume {path}")
+        finally:
+            if out is not None:
+                out.close()
+
+
+class ZipBackend:
+    """Streams zip members to disk; zipfile verifies each member's CRC."""
+    name = "zip"
+
+    def extract(self, archive_path, output_folder):
+        try:
+            archive = zipfile.ZipFile(archive_path)
+        except zipfile.BadZipFile as e:
+            raise UnsupportedArchive(str(e))
+        with archive:
+            for member in archive.infolist():
+                target = _safe_path(output_folder, member.filename)
+                if member.is_dir():
+                    os.makedirs(target, exist_ok=True)
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                try:
+                    with archive.open(member) as src, \
+                            open(target, "wb") as dst:
+                        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                except NotImplementedError as e:
+                    raise UnsupportedArchive(str(e))
+                except (zipfile.BadZipFile, RuntimeError) as e:
+                    raise ArchiveError(str(e))
+
+
+class SevenZipBackend:
+    """The 7z binary. Output is discarded rather than buffered."""
+    name = "7z"
+
+    def extract(self, archive_path, output_folder):
+        # 7z is dumb no space
+        output_switch = "-o" + output_folder
+        Popen_args = [
+            "7z",
+            "x",
+            "-y",
+            archive_path,
+            output_switch,
+        ]
+        _7zip_process = subprocess.Popen(Popen_args,
+                                         stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.PIPE)
+        stdout, stderr = _7zip_process.communicate()
+        if _7zip_process.returncode or stderr:
+            raise ArchiveError(stderr.decode())
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (RarStoreBackend, ZipBackend, SevenZipBackend)
+}
+
+
+def native_backend(archive_path):
+    with open(archive_path, "rb") as f:
+        magic = f.read(len(RAR_MARKER))
+    if magic == RAR_MARKER:
+        return RarStoreBackend()
+    if magic.startswith(b"PK"):
+        return ZipBackend()
+    return None
+
+
+def extract(archive_path, output_folder, backend="auto"):
+    """
+    Extract `archive_path` into `output_folder` with the named backend.
+    "auto" tries the native backend for the archive's format and falls
+    back to 7z when there is none or the archive is unsupported.
+    Returns the name of the backend that did the extraction.
+    """
+    if backend != "auto":
+        BACKENDS[backend]().extract(archive_path, output_folder)
+        return backend
+
+    native = native_backend(archive_path)
+    if native is not None:
+        try:
+            native.extract(archive_path, output_folder)
+            return native.name
+        except UnsupportedArchive:
+            pass
+    SevenZipBackend().extract(archive_path, output_folder)
+    return SevenZipBackend.name
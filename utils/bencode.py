@@ -0,0 +1,183 @@
+"""
+Dependency-free bencode reader.
+
+Values are walked in place over the raw buffer (bytes, bytearray, or
+any other buffer such as a memoryview or mmap, which isn't copied):
+anything not asked for, like the multi-megabyte `pieces` string of a
+.torrent, is skipped by offset without being copied, and the info hash
+is taken straight over the `info` dict's span of the original buffer.
+"""
+import hashlib
+
+_DICT = ord("d")
+_LIST = ord("l")
+_INT = ord("i")
+_END = ord("e")
+_COLON = ord(":")
+_DIGITS = frozenset(b"0123456789")
+
+
+class BencodeError(ValueError):
+    pass
+
+
+class _Reader:
+    __slots__ = ("buf", "view")
+
+    def __init__(self, data):
+        self.view = memoryview(data).cast("B")
+        # Indexing bytes is faster than indexing a memoryview; other
+        # buffers are read through the view, without a copy.
+        self.buf = data if isinstance(data, bytes) else self.view
+
+    def _find(self, char, i):
+        """Offset of the next `char` from `i`; runs of digits are short."""
+        buf = self.buf
+        while buf[i] != char:
+            i += 1
+        return i
+
+    def _int(self, start, end):
+        return int(bytes(self.buf[start:end]))
+
+    def _string_bounds(self, i):
+        colon = self._find(_COLON, i)
+        start = colon + 1
+        end = start + self._int(i, colon)
+        if end > len(self.buf):
+            raise BencodeError("String runs past the end of the data")
+        return start, end
+
+    def string(self, i):
+        """(memoryview of the string at `i`, offset after it)"""
+        if self.buf[i] not in _DIGITS:
+            raise BencodeError(f"Expected a string at offset {i}")
+        start, end = self._string_bounds(i)
+        return self.view[start:end], end
+
+    def skip(self, i):
+        """Offset just past the value at `i`, without building it."""
+        c = self.buf[i]
+        if c == _INT:
+            return self._find(_END, i) + 1
+        if c == _LIST or c == _DICT:
+            i += 1
+            while self.buf[i] != _END:
+                if c == _DICT:
+                    i = self.string(i)[1]
+                i = self.skip(i)
+            return i + 1
+        if c in _DIGITS:
+            return self._string_bounds(i)[1]
+        raise BencodeError(f"Invalid value at offset {i}")
+
+    def decode(self, i):
+        """(value at `i`, offset after it); strings are bytes."""
+        c = self.buf[i]
+        if c == _INT:
+            end = self._find(_END, i)
+            return self._int(i + 1, end), end + 1
+        if c == _LIST:
+            values = []
+            i += 1
+            while self.buf[i] != _END:
+                value, i = self.decode(i)
+                values.append(value)
+            return values, i + 1
+        if c == _DICT:
+            values = {}
+            i += 1
+            while self.buf[i] != _END:
+                key, i = self.string(i)
+                values[bytes(key)], i = self.decode(i)
+            return values, i + 1
+        if c in _DIGITS:
+            value, end = self.string(i)
+            return bytes(value), end
+        raise BencodeError(f"Invalid value at offset {i}")
+
+    def items(self, i):
+        """Yield (key, value start, value end) for the dict at `i`."""
+        if self.buf[i] != _DICT:
+            raise BencodeError(f"Expected a dict at offset {i}")
+        i += 1
+        while self.buf[i] != _END:
+            key, i = self.string(i)
+            end = self.skip(i)
+            yield key, i, end
+            i = end
+
+
+def decode(data):
+    """Decode a complete bencoded value from bytes."""
+    reader = _Reader(data)
+    try:
+        value, end = reader.decode(0)
+    except (IndexError, ValueError) as e:
+        raise BencodeError(str(e))
+    if end != len(reader.buf):
+        raise BencodeError("Trailing data after the bencoded value")
+    return value
+
+
+def _text(value):
+    return value.decode("utf-8", errors="replace")
+
+
+class TorrentMetadata:
+    """
+    What the fetcher needs from a .torrent: its name, hex info hash and
+    files as (path, length), paths relative to the torrent's name.
+    """
+    __slots__ = ("name", "info_hash", "files")
+
+    def __init__(self, name, info_hash, files):
+        self.name = name
+        self.info_hash = info_hash
+        self.files = files
+
+    @property
+    def top_level_names(self):
+        """
+        Names at the top of the torrent's file tree: the file itself for
+        a single file torrent.
+        """
+        if not self.files:
+            return [self.name]
+        return list(dict.fromkeys(
+            path.split("/")[0] for path, _ in self.files
+        ))
+
+
+def torrent_metadata(data):
+    """
+    Read a TorrentMetadata from the bytes of a .torrent file, hashing the
+    raw `info` dict in place and decoding only its name and file list.
+    """
+    reader = _Reader(data)
+    try:
+        info = None
+        for key, start, end in reader.items(0):
+            if key == b"info":
+                info = (start, end)
+        if info is None:
+            raise BencodeError("No info dict")
+        start, end = info
+        info_hash = hashlib.sha1(reader.view[start:end]).hexdigest()
+
+        name = None
+        files = []
+        for key, value_start, value_end in reader.items(start):
+            if key == b"name":
+                name = _text(reader.decode(value_start)[0])
+            elif key == b"files":
+                for entry in reader.decode(value_start)[0]:
+                    path = "/".join(_text(part) for part in entry[b"path"])
+                    files.append((path, entry[b"length"]))
+    except BencodeError:
+        raise
+    except (IndexError, KeyError, TypeError, ValueError) as e:
+        raise BencodeError(f"Invalid torrent: {e!r}")
+    if name is None:
+        raise BencodeError("Torrent info has no name")
+    return TorrentMetadata(name, info_hash, files)
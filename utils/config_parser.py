@@ -8,3 +8,13 @@ def get_config_values(config, section):
     else:
         config_parser.read_string(config)
     return config_parser[section]
+
+def get_optional_config_values(config, section):
+    """
+    Same as get_config_values, but an empty section is returned
+    when `section` is missing from the config.
+    """
+    try:
+        return get_config_values(config, section)
+    except KeyError:
+        return config_parser[config_parser.default_section]
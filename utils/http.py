@@ -0,0 +1,59 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.config_parser import get_optional_config_values
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class PooledSession(requests.Session):
+    """requests.Session applying a default timeout to every request."""
+
+    def __init__(self, timeout=None):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def _build_session(pool_size, retries, backoff_factor, timeout):
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+    )
+    session = PooledSession(timeout=timeout)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_http_session(config):
+    """
+    Keep-alive, connection-pooled session shared by the Jackett and
+    TVDB clients. Configured by the optional [http] section.
+    """
+    http_config = get_optional_config_values(config, "http")
+    settings = (
+        http_config.getint("pool_size", fallback=10),
+        http_config.getint("retries", fallback=3),
+        http_config.getfloat("backoff_factor", fallback=0.5),
+        http_config.getfloat("timeout", fallback=30),
+    )
+    with _sessions_lock:
+        if settings not in _sessions:
+            _sessions[settings] = _build_session(*settings)
+        return _sessions[settings]
@@ -0,0 +1,291 @@
+"""
+Counters, gauges and timing histograms for a run, exported in the
+Prometheus text format to a textfile (for node_exporter's textfile
+collector) and/or over HTTP, and printed as a per-run summary.
+
+Metrics are recorded in the module level METRICS registry:
+
+    METRICS.counter("searches_total").inc()
+    with METRICS.histogram("jackett_search_seconds").time():
+        ...
+"""
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import math
+import os
+import threading
+import time
+
+from utils.config_parser import get_optional_config_values
+
+PREFIX = "torrent_automator_"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+           120, 300)
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in pairs
+    ) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _header(self):
+        return [
+            f"# HELP {PREFIX}{self.name} {self.help}",
+            f"# TYPE {PREFIX}{self.name} {self.type}",
+        ]
+
+    def render(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        return self._header() + [
+            f"{PREFIX}{self.name}{_format_labels(key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+    def summary(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        return [
+            f"{self.name}{_format_labels(key)}: {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _labels_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_labels_key(labels)] = value
+
+
+class _Observations:
+    __slots__ = ("buckets", "count", "sum", "max")
+
+    def __init__(self, bounds):
+        self.buckets = [0] * len(bounds)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help="", buckets=BUCKETS):
+        super().__init__(name, help)
+        self.bounds = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = _labels_key(labels)
+        with self.lock:
+            observations = self.values.get(key)
+            if observations is None:
+                observations = self.values[key] = _Observations(self.bounds)
+            for i, bound in enumerate(self.bounds):
+                if value <= bound:
+                    observations.buckets[i] += 1
+                    break
+            observations.count += 1
+            observations.sum += value
+            observations.max = max(observations.max, value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block, in seconds."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def render(self):
+        lines = self._header()
+        name = PREFIX + self.name
+        with self.lock:
+            values = sorted(self.values.items())
+            for key, observations in values:
+                cumulative = 0
+                for bound, count in zip(self.bounds, observations.buckets):
+                    cumulative += count
+                    le = _format_labels(key, [("le", _format_value(bound))])
+                    lines.append(f"{name}_bucket{le} {cumulative}")
+                labels = _format_labels(key)
+                lines.append(f"{name}_sum{labels} {observations.sum!r}")
+                lines.append(f"{name}_count{labels} {observations.count}")
+        return lines
+
+    def summary(self):
+        with self.lock:
+            values = sorted(self.values.items())
+            return [
+                f"{self.name}{_format_labels(key)}: {o.count} calls, "
+                f"{o.sum:.2f}s total, {o.sum / o.count:.3f}s avg, "
+                f"{o.max:.3f}s max"
+                for key, o in values if o.count
+            ]
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise Exception(f"{name} is already a {metric.type}")
+            return metric
+
+    def counter(self, name, help=""):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help=""):
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name, help="", buckets=BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def _sorted(self):
+        with self.lock:
+            return [self.metrics[name] for name in sorted(self.metrics)]
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._sorted():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        lines = []
+        for metric in self._sorted():
+            lines.extend(metric.summary())
+        return lines
+
+    def write_textfile(self, path):
+        """Write atomically, so a collector never reads a partial file."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host=""):
+        """Serve /metrics from a daemon thread; returns the server."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+
+METRICS = Registry()
+
+
+class MetricsExporter:
+    """
+    Exports METRICS as configured by the optional [metrics] section:
+    a `textfile` path rewritten on every export(), an HTTP `port` (0 for
+    none) and whether to print a `summary` at the end of a run.
+
+    Each `job` (e.g. download, status) writes its own textfile, named
+    after `textfile` with the job as a suffix, so runs of different
+    commands don't overwrite each other's metrics.
+    """
+
+    def __init__(self, registry=METRICS, textfile=None, port=0,
+                 summary=True, job=None):
+        self.registry = registry
+        if textfile and job:
+            root, ext = os.path.splitext(textfile)
+            textfile = f"{root}_{job}{ext}"
+        self.textfile = textfile
+        self.port = port
+        self.print_summary = summary
+        self.server = None
+
+    @classmethod
+    def from_config(cls, config, job=None, registry=METRICS):
+        config_section = get_optional_config_values(config, "metrics")
+        return cls(
+            registry,
+            textfile=config_section.get("textfile") or None,
+            port=config_section.getint("port", fallback=0),
+            summary=config_section.getboolean("summary", fallback=True),
+            job=job,
+        )
+
+    def start(self):
+        if self.port and self.server is None:
+            self.server = self.registry.serve(self.port)
+
+    def export(self):
+        self.registry.gauge(
+            "last_export_timestamp_seconds", "When these metrics were written"
+        ).set(time.time())
+        if self.textfile:
+            self.registry.write_textfile(self.textfile)
+
+    def finish(self):
+        """Final export, and the run summary."""
+        self.export()
+        if self.print_summary:
+            lines = self.registry.summary()
+            if lines:
+                print("Run summary:")
+                for line in lines:
+                    print(f"  {line}")
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
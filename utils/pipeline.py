@@ -0,0 +1,153 @@
+import queue
+import threading
+import time
+import traceback
+
+from utils.metrics import METRICS
+
+_DONE = object()
+
+stage_seconds = METRICS.histogram("pipeline_stage_seconds",
+                                  "Time per item in each pipeline stage")
+
+
+class Stage:
+    """
+    One step of a Pipeline: `func` applied to each item by `workers`
+    threads. `func` returns the item to pass on, or None to drop it.
+    """
+
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+        self._running = 0
+
+    def _record(self, busy, error=False):
+        stage_seconds.observe(busy, stage=self.name)
+        with self._lock:
+            self.processed += 1
+            self.errors += error
+            self.busy += busy
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    def report(self):
+        elapsed = self.elapsed
+        rate = self.processed / elapsed if elapsed else 0.0
+        return (
+            f"{self.name}: {self.processed} items in {elapsed:.1f}s "
+            f"({rate:.2f}/s, {self.busy:.1f}s busy over {self.workers} "
+            f"workers, {self.errors} errors)"
+        )
+
+
+class Pipeline:
+    """
+    Producer/consumer chain of Stages, each with its own worker threads,
+    connected by queues of at most `queue_size` items. A slow stage only
+    backs up the stages feeding it once its queue is full, so e.g. a slow
+    download doesn't hold up searches for other items.
+    """
+
+    def __init__(self, stages, queue_size=16):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    @staticmethod
+    def _get(inbox, cancelled):
+        while not cancelled.is_set():
+            try:
+                return inbox.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    @staticmethod
+    def _put(outbox, item, cancelled):
+        while not cancelled.is_set():
+            try:
+                return outbox.put(item, timeout=0.1)
+            except queue.Full:
+                pass
+
+    def _work(self, stage, inbox, outbox, cancelled):
+        while True:
+            item = self._get(inbox, cancelled)
+            if item is _DONE:
+                # Let sibling workers see it too; the last one out
+                # passes it downstream.
+                self._put(inbox, _DONE, cancelled)
+                with stage._lock:
+                    stage._running -= 1
+                    last = stage._running == 0
+                if last:
+                    stage.finished = time.monotonic()
+                    self._put(outbox, _DONE, cancelled)
+                return
+
+            started = time.monotonic()
+            try:
+                result = stage.func(item)
+            except Exception:
+                print(f"Error in pipeline stage {stage.name}:")
+                traceback.print_exc()
+                stage._record(time.monotonic() - started, error=True)
+                continue
+            stage._record(time.monotonic() - started)
+            if result is not None:
+                self._put(outbox, result, cancelled)
+
+    def _feed(self, items, inbox, cancelled):
+        for item in items:
+            self._put(inbox, item, cancelled)
+        self._put(inbox, _DONE, cancelled)
+
+    def run(self, items):
+        """
+        Feed `items` through every stage, yielding the last stage's
+        results in completion order. `items` is iterated on a feeder
+        thread, so it must not touch thread-bound state.
+        """
+        queues = [queue.Queue(self.queue_size) for _ in self.stages]
+        queues.append(queue.Queue())
+        cancelled = threading.Event()
+        threads = [threading.Thread(target=self._feed,
+                                    args=(items, queues[0], cancelled))]
+        for i, stage in enumerate(self.stages):
+            stage._running = stage.workers
+            stage.started = time.monotonic()
+            threads.extend(
+                threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[i], queues[i + 1], cancelled),
+                )
+                for _ in range(stage.workers)
+            )
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            while True:
+                result = queues[-1].get()
+                if result is _DONE:
+                    return
+                yield result
+        finally:
+            # Stops every thread within a queue timeout if the caller
+            # gave up early.
+            cancelled.set()
+
+    def report(self):
+        return [stage.report() for stage in self.stages]
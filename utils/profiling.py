@@ -0,0 +1,182 @@
+"""
+Profiling for app.py runs (--profile): a cProfile or sampling profiler
+around the whole run, plus per-action counts and durations of the SQL
+statements SQLAlchemy executes.
+
+cProfile only sees the main thread; the sampler records wall-clock stacks
+of every thread (search, fetch and sync workers included) and writes them
+collapsed, one `frame;frame;frame count` line per stack, for flamegraph.pl,
+speedscope or inferno.
+"""
+import cProfile
+from contextlib import contextmanager
+import os
+import pstats
+import sys
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+MODES = ("cprofile", "sample")
+EXTENSIONS = {"cprofile": ".prof", "sample": ".folded"}
+
+
+class QueryStats:
+    """Count and time the SQL statements executed during each action."""
+
+    def __init__(self):
+        self.current = None
+        self.actions = {}
+        self.lock = threading.Lock()
+
+    def install(self):
+        event.listen(Engine, "before_cursor_execute", self._before)
+        event.listen(Engine, "after_cursor_execute", self._after)
+
+    def uninstall(self):
+        event.remove(Engine, "before_cursor_execute", self._before)
+        event.remove(Engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context,
+                executemany):
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context,
+               executemany):
+        duration = time.perf_counter() - conn.info["profile_started"].pop()
+        # Bound parameters keep statements identical between executions,
+        # so N+1 patterns show up as one statement with a large count.
+        statement = " ".join(statement.split())
+        with self.lock:
+            statements = self.actions.setdefault(self.current, {})
+            count, total = statements.get(statement, (0, 0.0))
+            statements[statement] = (count + 1, total + duration)
+
+    @contextmanager
+    def action(self, name):
+        previous, self.current = self.current, name
+        try:
+            yield
+        finally:
+            self.current = previous
+
+    def report(self, name, top=10, width=160):
+        with self.lock:
+            statements = dict(self.actions.get(name, {}))
+        count = sum(c for c, _ in statements.values())
+        total = sum(t for _, t in statements.values())
+        lines = [f"SQL [{name}]: {count} statements "
+                 f"({len(statements)} distinct), {total:.3f}s"]
+        ranked = sorted(statements.items(), key=lambda s: s[1], reverse=True)
+        for statement, (c, t) in ranked[:top]:
+            if len(statement) > width:
+                statement = statement[:width - 3] + "..."
+            lines.append(f"  {c:>7} x {t:8.3f}s  {statement}")
+        return lines
+
+
+def _frame_name(code):
+    return "{} ({}:{})".format(code.co_name,
+                               os.path.basename(code.co_filename),
+                               code.co_firstlineno)
+
+
+class Sampler:
+    """
+    Wall-clock sampling profiler: every `interval` seconds, records the
+    stack of every other thread, collapsed to a `;`-joined string.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack = ";".join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.samples += 1
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name="profiler")
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    Profile a run with `mode` (cprofile or sample), writing the profile
+    to `output` (by default profile_<job> with a .prof or .folded
+    extension) and printing SQL statement stats after each action().
+    """
+
+    def __init__(self, mode="cprofile", output=None, job=None,
+                 interval=0.005, top=10):
+        if mode not in MODES:
+            raise Exception(f"Unknown profiler {mode}, use one of {MODES}")
+        self.mode = mode
+        self.output = output or "profile_{}{}".format(job or "run",
+                                                      EXTENSIONS[mode])
+        self.top = top
+        self.queries = QueryStats()
+        if mode == "cprofile":
+            self.profiler = cProfile.Profile()
+        else:
+            self.profiler = Sampler(interval)
+
+    def start(self):
+        self.queries.install()
+        if self.mode == "cprofile":
+            self.profiler.enable()
+        else:
+            self.profiler.start()
+
+    @contextmanager
+    def action(self, name):
+        started = time.monotonic()
+        with self.queries.action(name):
+            try:
+                yield
+            finally:
+                print(f"Profile [{name}]: "
+                      f"{time.monotonic() - started:.3f}s")
+                for line in self.queries.report(name, top=self.top):
+                    print(line)
+
+    def stop(self):
+        if self.mode == "cprofile":
+            self.profiler.disable()
+            self.profiler.dump_stats(self.output)
+            stats = pstats.Stats(self.profiler)
+            stats.sort_stats("cumulative").print_stats(self.top * 2)
+        else:
+            self.profiler.stop()
+            self.profiler.write(self.output)
+            print(f"{self.profiler.samples} samples")
+        self.queries.uninstall()
+        print(f"Profile written to {self.output}")
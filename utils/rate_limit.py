@@ -0,0 +1,31 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket allowing `rate` calls per second on
+    average, with bursts of up to `burst` calls.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst,
+                self.tokens + (now - self.updated_at) * self.rate,
+            )
+            self.updated_at = now
+            delay = (1 - self.tokens) / self.rate if self.tokens < 1 else 0
+            self.tokens -= 1
+        if delay:
+            time.sleep(delay)